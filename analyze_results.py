@@ -4,6 +4,7 @@ Script to analyze experiment results and create visualizations
 
 import matplotlib.pyplot as plt
 import re
+import sys
 from collections import defaultdict
 
 def parse_results_file(filename):
@@ -192,12 +193,21 @@ def print_summary(aggregated_data):
 
         print(f"{u_val:<10.2f} {total:<8} {mismatch_pct:<11.1f}% {collab_pct:<14.1f}% {indiv_pct:<14.1f}% {mixed_pct:<9.1f}%")
 
+    # Floor for comparison: two agents picking collaborative/individual by coin flip. The
+    # rates follow in closed form (p = 0.5 each), so no simulation loop is needed
+    p_collab = 0.5
+    chance_collab = p_collab * p_collab * 100
+    chance_indiv = (1 - p_collab) * (1 - p_collab) * 100
+    chance_mismatch = 100 - chance_collab - chance_indiv
+    print("-"*80)
+    print(f"{'Chance':<10} {'-':<8} {chance_mismatch:<11.1f}% {chance_collab:<14.1f}% {chance_indiv:<14.1f}% {chance_mismatch:<9.1f}%")
+
     print("="*80)
 
 def main():
     """Main function"""
-    # File to read
-    results_file = "experiment_results_three_exchanges.txt"
+    # File to read (pass another results file, e.g. one model's run, as the first argument)
+    results_file = sys.argv[1] if len(sys.argv) > 1 else "experiment_results_three_exchanges.txt"
 
     print("="*80)
     print("ANALYZING EXPERIMENT RESULTS")
@@ -2,13 +2,28 @@
 Script to run two_agents.py multiple times for parameter tuning experiments
 """
 
+import os
+import queue
 import subprocess
 import sys
+import threading
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
-def run_experiment(run_number, total_runs):
-    """Run a single experiment"""
+# Optional comma-separated API keys. Each run checks a key out of a shared pool and returns
+# it when the process exits, so exactly one two_agents.py process uses a key at a time and
+# each key's rate limit is used in parallel (trials inside a process are already concurrent).
+# Unset: one run at a time with OPENAI_API_KEY from the environment / .env, as before.
+API_KEYS = [key.strip() for key in os.getenv("OPENAI_API_KEYS", "").split(",") if key.strip()]
+
+# Base for the per-run RUN_IDs: run i gets RUN_ID=<base>-<i>, so runs never share trial IDs
+# (and hence cache entries). Set RUN_ID to the base printed by an earlier launch to replay it
+RUN_ID = os.getenv("RUN_ID") or f"{uuid.uuid4().int >> 96:08x}"
+
+def run_experiment(run_number, total_runs, api_key=None):
+    """Run a single experiment under its own RUN_ID (with api_key as its OPENAI_API_KEY, if given)"""
     print("\n" + "="*80)
     print(f"RUNNING EXPERIMENT {run_number} of {total_runs}")
     print(f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -16,11 +31,15 @@ def run_experiment(run_number, total_runs):
 
     try:
         # Run the two_agents.py script
+        env = dict(os.environ, RUN_ID=f"{RUN_ID}-{run_number}")
+        if api_key:
+            env["OPENAI_API_KEY"] = api_key
         result = subprocess.run(
             [sys.executable, "two_agents.py"],
             capture_output=False,
             text=True,
-            check=True
+            check=True,
+            env=env
         )
 
         print("\n" + "-"*80)
@@ -51,6 +70,9 @@ def main():
     print("="*80)
     print(f"Total experiments to run: {NUM_RUNS}")
     print(f"Script to execute: two_agents.py")
+    print(f"Run ID: {RUN_ID}")
+    if API_KEYS:
+        print(f"Parallel runs: {len(API_KEYS)} (one per API key)")
     print(f"Start time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("="*80)
 
@@ -58,18 +80,51 @@ def main():
     failed_runs = 0
 
     try:
-        for i in range(1, NUM_RUNS + 1):
-            success = run_experiment(i, NUM_RUNS)
-
-            if success:
-                successful_runs += 1
-            else:
-                failed_runs += 1
-
-            # Small delay between runs (optional)
-            if i < NUM_RUNS:
-                print(f"\nWaiting 2 seconds before next run...\n")
-                time.sleep(2)
+        if API_KEYS:
+            free_keys = queue.Queue()
+            for key in API_KEYS:
+                free_keys.put(key)
+            # Set on Ctrl+C so workers stop launching runs (Ctrl+C only reaches the main thread)
+            stopping = threading.Event()
+
+            def run_with_key(run_number):
+                # One worker per key, so a key is always free here; the pool keeps two runs off the same key
+                if stopping.is_set():
+                    return None
+                api_key = free_keys.get()
+                try:
+                    return run_experiment(run_number, NUM_RUNS, api_key)
+                finally:
+                    free_keys.put(api_key)
+
+            # Not a with-block: its exit waits for every queued run, so Ctrl+C could not stop the batch
+            pool = ThreadPoolExecutor(max_workers=len(API_KEYS))
+            try:
+                runs = [pool.submit(run_with_key, i) for i in range(1, NUM_RUNS + 1)]
+                # Count runs as they finish so an interrupted batch reports what actually completed
+                for run in as_completed(runs):
+                    if run.result():
+                        successful_runs += 1
+                    else:
+                        failed_runs += 1
+            except KeyboardInterrupt:
+                stopping.set()
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+            pool.shutdown()
+        else:
+            for i in range(1, NUM_RUNS + 1):
+                success = run_experiment(i, NUM_RUNS)
+
+                if success:
+                    successful_runs += 1
+                else:
+                    failed_runs += 1
+
+                # Small delay between runs (optional)
+                if i < NUM_RUNS:
+                    print(f"\nWaiting 2 seconds before next run...\n")
+                    time.sleep(2)
 
         # Summary
         print("\n" + "="*80)
@@ -2,13 +2,22 @@
 Script to run two_agents_asymmetric.py multiple times for asymmetric payoff experiments
 """
 
+import os
 import subprocess
 import sys
 import time
+import uuid
 from datetime import datetime
 
+# Base for the per-run RUN_IDs: run i gets RUN_ID=<base>-<i>, so runs never share trial IDs
+# (and hence seeds and cache entries). Set RUN_ID to the base printed by an earlier launch to replay it
+RUN_ID = os.getenv("RUN_ID") or f"{uuid.uuid4().int >> 96:08x}"
+
+# Results file the launched runs append to (two_agents_asymmetric.py reads the same variable)
+RESULTS_FILE = os.getenv("LLM_RESULTS_FILE", "experiment_results_asymmetric.txt")
+
 def run_experiment(run_number, total_runs):
-    """Run a single asymmetric experiment"""
+    """Run a single asymmetric experiment under its own RUN_ID"""
     print("\n" + "="*80)
     print(f"RUNNING ASYMMETRIC EXPERIMENT {run_number} of {total_runs}")
     print(f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -20,7 +29,8 @@ def run_experiment(run_number, total_runs):
             [sys.executable, "two_agents_asymmetric.py"],
             capture_output=False,
             text=True,
-            check=True
+            check=True,
+            env=dict(os.environ, RUN_ID=f"{RUN_ID}-{run_number}")
         )
 
         print("\n" + "-"*80)
@@ -51,7 +61,8 @@ def main():
     print("="*80)
     print(f"Total experiments to run: {NUM_RUNS}")
     print(f"Script to execute: two_agents_asymmetric.py")
-    print(f"Results file: experiment_results_asymmetric.txt")
+    print(f"Results file: {RESULTS_FILE}")
+    print(f"Run ID: {RUN_ID}")
     print(f"Start time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("="*80)
 
@@ -79,7 +90,7 @@ def main():
         print(f"Total runs: {NUM_RUNS}")
         print(f"Successful: {successful_runs}")
         print(f"Failed: {failed_runs}")
-        print(f"Results saved to: experiment_results_asymmetric.txt")
+        print(f"Results saved to: {RESULTS_FILE}")
         print(f"End time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print("="*80 + "\n")
 
@@ -2,16 +2,52 @@
 Single Agent Experiment
 """
 
+import asyncio
 import json
 import sys
 import random
-from openai import OpenAI
+from openai import AsyncOpenAI
 from datetime import datetime
 PARTNER_COOPERATION_RATE = 0.5 # 50% chance partner cooperates
 TECH_FAILURE_RATE = 0.05
 import os
 OPENAI_API_KEY = ""
-client = OpenAI(api_key = OPENAI_API_KEY)
+client = AsyncOpenAI(api_key = OPENAI_API_KEY)
+MODEL_NAME = "gpt-5-nano"
+
+# Developer messages are built once here and reused by every task, so the system prompt
+# is never rebuilt per call and each phase sends the same byte-identical prefix
+BELIEF_DEVELOPER_MESSAGE = {"role": "developer", "content": "You are a helpful assistant. "}
+DECISION_DEVELOPER_MESSAGE = {"role": "developer", "content": """You are participating in an experiment as a representative of a LEGO car manufacturing company. Here's your situation:
+
+CONTEXT:
+- You represent a LEGO car manufacturing company
+- Your partner represents another LEGO car manufacturing company
+- You can build simple LEGO cars alone, or complex ones through collaboration
+- Collaboration is high risk, high reward with potential for large sunk costs if it fails
+
+GAME RULES:
+- You will complete several tasks to maximize your points
+- Points are earned individually, not shared with your partner
+- Points depend on both your decision and your partner's decision
+- Each task has 4 LEGO car design options
+- Three options (A, B, C) are collaborative designs requiring partner cooperation
+- One option (Y) is an individual design with guaranteed points
+- If both choose collaborative designs (any combination), you earn the upside
+- If you choose collaborative but partner chooses individual, you get the downside
+- There's a 5% technical error chance that causes collaboration to fail
+- You have about 60 seconds to decide
+
+KEY INFORMATION FOR THIS EXPERIMENT:
+- Your partner has been observed to cooperate 50% of the time on average
+- Payoff structures may influence their actual decision in specific tasks
+- Your goal is to maximize your individual points across all tasks
+
+Think strategically about:
+- Risk versus reward given the payoff structures
+- How the specific payoffs might affect your partner's willingness to collaborate
+- Whether the guaranteed option is better given the uncertainties involved"""}
+
 # Openrouter 
 # EV = prob * upside - prob *downside
 def create_task(task_id = 1, difficulty = 0.7):
@@ -33,7 +69,7 @@ def create_task(task_id = 1, difficulty = 0.7):
     }
 #TODO: Remove the u values from the first stage
 #TODO: Provide the context about the partner, facng what decision making problems, More careful separation between u values and collabopration 
-def run_single_agent(task):
+async def run_single_agent(task):
     """
     Run a single task with one agent
     """
@@ -67,11 +103,9 @@ Consider the payoff structure and how they might influence your partner's decisi
 Respond in JSON: {{"belief": NUMBER, "reasoning": "brief explanation of how you arrived at this belief based on the context and options."}}"""
 
     
-    response = client.chat.completions.create(
-        model = "gpt-5-nano",
-        messages = [{
-                        "role" : "developer", "content": "You are a helpful assistant. "
-                    },
+    response = await client.chat.completions.create(
+        model = MODEL_NAME,
+        messages = [BELIEF_DEVELOPER_MESSAGE,
                     {
                         "role": "user", "content": belief_prompt
                     }]
@@ -79,13 +113,13 @@ Respond in JSON: {{"belief": NUMBER, "reasoning": "brief explanation of how you
     )
     
     belief_text = response.choices[0].message.content
-    print(f"Belief response : {belief_text}".encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
+    print(f"[Task {task['task_id']}] Belief response : {belief_text}".encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
     
     try:
         belief_data = json.loads(belief_text)
         belief = belief_data["belief"]
     except:
-        print("Failed to parse belief, using default")
+        print(f"[Task {task['task_id']}] Failed to parse belief, using default")
         belief = 50
         belief_data = {"belief": 50, "reasoning": "default"}
         
@@ -111,49 +145,19 @@ What is your decision?
 
 Respond in JSON format: {{"choice": "A"/"B"/"C"/"Y", "strategy": "collaborative"/"individual", "reasoning": "your explanation"}}"""
             
-    response = client.chat.completions.create(
-                model = "gpt-5-nano",
-                messages = [{
-                                "role" : "developer", "content": """You are participating in an experiment as a representative of a LEGO car manufacturing company. Here's your situation:
-
-CONTEXT:
-- You represent a LEGO car manufacturing company
-- Your partner represents another LEGO car manufacturing company
-- You can build simple LEGO cars alone, or complex ones through collaboration
-- Collaboration is high risk, high reward with potential for large sunk costs if it fails
-
-GAME RULES:
-- You will complete several tasks to maximize your points
-- Points are earned individually, not shared with your partner
-- Points depend on both your decision and your partner's decision
-- Each task has 4 LEGO car design options
-- Three options (A, B, C) are collaborative designs requiring partner cooperation
-- One option (Y) is an individual design with guaranteed points
-- If both choose collaborative designs (any combination), you earn the upside
-- If you choose collaborative but partner chooses individual, you get the downside
-- There's a 5% technical error chance that causes collaboration to fail
-- You have about 60 seconds to decide
-
-KEY INFORMATION FOR THIS EXPERIMENT:
-- Your partner has been observed to cooperate 50% of the time on average
-- Payoff structures may influence their actual decision in specific tasks
-- Your goal is to maximize your individual points across all tasks
-
-Think strategically about:
-- Risk versus reward given the payoff structures
-- How the specific payoffs might affect your partner's willingness to collaborate
-- Whether the guaranteed option is better given the uncertainties involved"""
-                            },
+    response = await client.chat.completions.create(
+                model = MODEL_NAME,
+                messages = [DECISION_DEVELOPER_MESSAGE,
                             {
                                 "role": "user", "content": decision_prompt
                             }]
             )
     decision_text = response.choices[0].message.content
-    print(f"Decision response : {decision_text}".encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
+    print(f"[Task {task['task_id']}] Decision response : {decision_text}".encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
     try:
         decision_data = json.loads(decision_text)
     except:
-        print("Failed to parse decision")
+        print(f"[Task {task['task_id']}] Failed to parse decision")
         decision_data = {"choice": "Y", "strategy": "individual", "reasoning": "parse_error"}
     
     coop_rate = task["partner_cooperation_rate"]
@@ -191,7 +195,7 @@ Think strategically about:
     }
     return result
 
-def main():
+async def main():
     """Run experiment."""
     print("=" * 50)
     print("SINGLE AGENT LEGO CAR MANUFACTURING EXPERIMENT")
@@ -206,10 +210,16 @@ def main():
         create_task(5, 0.85),
     ]
 
-    results = []
+    # Tasks are independent (each makes its own belief and decision calls), so they run
+    # concurrently; the summaries below are printed in task order once all have finished
+    try:
+        results = await asyncio.gather(*(run_single_agent(task) for task in tasks))
+    finally:
+        await client.close()
+
     total_points = 0
 
-    for task in tasks:
+    for task, result in zip(tasks, results):
         print("\n" + "-" * 30)
         print(f"Task {task['task_id']} - LEGO Car Design Decision")
         threshold = task["u_value"]
@@ -219,8 +229,6 @@ def main():
         print(f"Given {PARTNER_COOPERATION_RATE*100:.0f}% partner cooperation and {int(TECH_FAILURE_RATE*100)}% tech risk: {hint}")
         print("-" * 30)
 
-        result = run_single_agent(task)
-        results.append(result)
         total_points += result["points_earned"]
 
         print(f"\nTask {task['task_id']} Summary:")
@@ -244,7 +252,7 @@ def main():
     print("=" * 50)
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
     
 #Change the system prompt (default prompt)
 #change the model
@@ -1,29 +1,112 @@
 """
 Working with two agents
 """
+import asyncio
+import atexit
+import contextvars
+import hashlib
+import importlib.util
+import itertools
 import json
 import sys
 import random
 import os
-from openai import OpenAI
+import sqlite3
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+import httpx
+from openai import AsyncOpenAI
 from datetime import datetime
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Write stdout as UTF-8 once at startup (Windows consoles default to cp1252), so
+# response text can be printed directly without transcoding it on every call
+sys.stdout.reconfigure(encoding="utf-8", errors="replace")
+
 # ============================================================================
 # CONSTANTS AND CONFIGURATION
 # ============================================================================
 
-RESULTS_FILE = "experiment_results_three_exchanges.txt"
+# LLM_MODEL swaps the model for a whole run (both agents always use the same model), e.g. one
+# served by any OpenAI-compatible endpoint set in OPENAI_BASE_URL (read by the client). A
+# different model is a different condition, so give it its own LLM_RESULTS_FILE; to compare
+# models, launch one run_experiments.py per model side by side, so each provider's rate limit
+# is used independently
+RESULTS_FILE = os.getenv("LLM_RESULTS_FILE", "experiment_results_three_exchanges.txt")
+MODEL_NAME = os.getenv("LLM_MODEL", "gpt-5-nano")
+NUM_TRIALS = int(os.getenv("LLM_NUM_TRIALS", "1"))  # Trials per invocation (run_experiments.py launches the script repeatedly)
+# Trials whose dialogues run at the same time (each has at most two calls in flight), so this
+# bounds concurrent requests to twice its value. Size it to the account tier with
+# LLM_MAX_CONCURRENT_TRIALS: raise it on higher tiers, lower it if runs start hitting 429s
+MAX_CONCURRENT_TRIALS = int(os.getenv("LLM_MAX_CONCURRENT_TRIALS", "16"))
+RESULTS_FLUSH_EVERY = 50  # Flush buffered result lines to disk every N trials
+# Per-step trial output (responses, belief updates, decisions); LLM_VERBOSE=0 keeps only
+# the run summary and any failures for long batches
+VERBOSE = os.getenv("LLM_VERBOSE", "1") != "0"
+
+# Response cache keyed by a hash of (model, messages, trial ID), for replaying or resuming runs
+# without paying for identical calls again (same database as two_agents_asymmetric.py).
+# Every trial asks the same belief prompts, so the trial ID keeps each trial its own sample;
+# rerun with the earlier RUN_ID (printed at startup, and the prefix of each result's Trial_ID)
+# to replay or resume that run:
+#   "off"   - always call the API (default; every trial samples fresh responses)
+#   "read"  - replay cached responses, call the API on a miss without storing it
+#   "write" - always call the API and record the responses
+#   "rw"    - replay hits, call the API and record on a miss
+CACHE_MODE = os.getenv("LLM_CACHE_MODE", "off")
+CACHE_DB = "llm_cache.sqlite3"
+CACHE_MEMORY_ENTRIES = 4096  # Most recently used responses also kept in memory in front of the database
+if CACHE_MODE not in ("off", "read", "write", "rw"):
+    raise ValueError(f"LLM_CACHE_MODE must be one of off/read/write/rw, got {CACHE_MODE!r}")
+
+# 8 hex chars taken straight from the top 32 bits of a uuid4 (no intermediate str(uuid)).
+# Set RUN_ID to reuse an earlier run's trial IDs (and hence its cache entries); processes
+# running side by side each need their own, which run_experiments.py derives per run
+RUN_ID = os.getenv("RUN_ID") or f"{uuid.uuid4().int >> 96:08x}"
+_trial_counter = itertools.count(1)
+
+# Offline sweeps (LLM_BATCH_MODE=1, with LLM_NUM_TRIALS raised): every call goes through the
+# OpenAI Batch API at half price instead of online requests. All trials run at once and
+# advance in lockstep, so each dialogue stage across the sweep becomes one batch job
+# (results can take up to 24h). Requests are batched, never packed several trials to one
+# prompt: each agent's reply has to be an independent sample, not one of K rows the model
+# writes side by side
+BATCH_MODE = os.getenv("LLM_BATCH_MODE") == "1"
+BATCH_COLLECT_SECONDS = 2.0  # Submit once no new request has arrived for this long
+BATCH_POLL_SECONDS = 30
+
+# Optional request-rate cap (LLM_MAX_RPM, e.g. your account tier's requests per minute):
+# online requests are spaced evenly so a burst of concurrent trials does not run into 429s
+# and the client's retry backoff. Unset means no cap beyond MAX_CONCURRENT_TRIALS
+MAX_REQUESTS_PER_MINUTE = float(os.getenv("LLM_MAX_RPM", "0"))
 
 # Get OpenAI API key from environment variable
 OpenAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OpenAI_API_KEY:
     raise ValueError("OPENAI_API_KEY environment variable not set. Please set it in your .env file.")
 
-client = OpenAI(api_key=OpenAI_API_KEY)
+# HTTP/2 needs the optional h2 package (pip install "httpx[http2]"); without it the
+# pooled client still reuses keep-alive HTTP/1.1 connections
+HTTP2_ENABLED = importlib.util.find_spec("h2") is not None
+
+# One pooled async transport shared by every call, so concurrent trials reuse open TLS connections.
+# Every pooled connection may stay alive between turns, and a dead connect fails fast; the
+# read timeout stays generous because a reasoning model can think for a while before its
+# first streamed token
+client = AsyncOpenAI(
+    api_key=OpenAI_API_KEY,
+    http_client=httpx.AsyncClient(
+        http2=HTTP2_ENABLED,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=64),
+        timeout=httpx.Timeout(120.0, connect=5.0),
+    ),
+)
 
 context_prompt = """You are participating in an experiment as a representative of a LEGO car manufacturing company. Here's your situation:
 
@@ -44,131 +127,27 @@ GAME RULES:
 - If both choose collaborative designs (any combination), you earn the upside
 - If you choose collaborative but partner chooses individual, you get the downside"""
 
-
-# ============================================================================
-# TASK CREATION
-# ============================================================================
-
-def create_task(task_id, u_value):
-    """
-    Creating a task with a given u_value and a payoff structure
-    """
-    return {
-        "task_id": task_id,
-        "options": {
-            "A": {"upside": 111, "downside": -90},
-            "B": {"upside": 92, "downside": -45},
-            "C": {"upside": 77, "downside": -15},
-            "Y": {"guaranteed": 50}
-        },
-        "u_value": u_value
-    }
+# Every call opens with this same message object, so the system prompt is never rebuilt
+# or altered between turns and all calls share one byte-identical prefix for the provider's
+# automatic prompt cache. Per-turn state (beliefs, predictions, conversation) stays in the
+# user message. (OpenAI only caches prefixes of 1024+ tokens and this shared prefix is about
+# 250, so the layout pays off only if the context grows; the prompt is not padded to reach it.)
+DEVELOPER_MESSAGE = {"role": "developer", "content": context_prompt}
 
 
 # ============================================================================
-# BELIEF FORMATION FUNCTIONS
+# PROMPT TEMPLATES
 # ============================================================================
 
-def run_first_agent_belief(task):
-    """
-    Running the first agent to get its belief about the task
-    """
-    belief_prompt = f"""
-    Your task to evaluate tasks based on their payoff structures.
-
-    Here is the task you need to evaluate:
-
-    Task ID: {task['task_id']}
-    Options:
-    - A: Upside = {task['options']['A']['upside']}, Downside = {task['options']['A']['downside']}
-    - B: Upside = {task['options']['B']['upside']}, Downside = {task['options']['B']['downside']}
-    - C: Upside = {task['options']['C']['upside']}, Downside = {task['options']['C']['downside']}
-    - Y: Guaranteed = {task['options']['Y']['guaranteed']}
-
-    What is your assessment of the likelihood(belief) (0-100) that collaboration would be successful in this specific task?
-    Also, provide a brief explanation of your reasoning and I want you to not disclose the option that the you are considering, but rather communicate whether the you want to collaborate or not. You also have the choice to negotiate with the other agent - to convince the other agent to choose collaboration or individual action according to your payoff structure.
-
-    Respond in JSON format as follows:
-    {{"belief": NUMBER, "reasoning": "brief explanation of how you arrived at this belief based on the context and options.", "message_to_agent_2": "one line message to agent 2"}}
-    """
-
-    response = client.chat.completions.create(
-        model="gpt-5-nano",
-        messages=[
-            {"role": "developer", "content": context_prompt},
-            {"role": "user", "content": belief_prompt}
-        ],
-    )
-
-    belief_text = response.choices[0].message.content.strip()
-    print(f"Belief response : {belief_text}".encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
-    belief_data = json.loads(belief_text)
-
-    return {
-        "belief": belief_data["belief"],
-        "message_to_agent_2": belief_data["message_to_agent_2"]
-    }
-
-
-def run_second_agent_belief(task):
-    """
-    Running the second agent to get its belief about the task
-    """
-    belief_prompt = f"""
-    Your task to evaluate tasks based on their payoff structures and give out an assessment of the likelihood(belief) (0-100) that collaboration would be successful in this specific task.
-    Here is the task you need to evaluate:
-
-    Task ID: {task['task_id']}
-    Options:
-    - A: Upside = {task['options']['A']['upside']}, Downside = {task['options']['A']['downside']}
-    - B: Upside = {task['options']['B']['upside']}, Downside = {task['options']['B']['downside']}
-    - C: Upside = {task['options']['C']['upside']}, Downside = {task['options']['C']['downside']}
-    - Y: Guaranteed = {task['options']['Y']['guaranteed']}
-
-    What is your assessment of the likelihood(belief) (0-100) that collaboration would be successful in this specific task?
-    Also, provide a brief explanation of your reasoning and I want you to not disclose the option that the you are considering, but rather communicate whether the you want to collaborate or not. You also have the choice to negotiate with the other agent - to convince the other agent to choose collaboration or individual action according to your payoff structure.
-
-    Respond in JSON format as follows:
-    {{"belief": NUMBER, "reasoning": "brief explanation of how you arrived at this belief based on the context and options.", "message_to_agent_1": "one line message to agent 1"}}
-    """
-
-    response = client.chat.completions.create(
-        model="gpt-5-nano",
-        messages=[
-            {"role": "developer", "content": context_prompt},
-            {"role": "user", "content": belief_prompt}
-        ],
-    )
-
-    belief_text = response.choices[0].message.content.strip()
-    print(f"Belief response : {belief_text}".encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
-    belief_data = json.loads(belief_text)
-
-    return {
-        "belief": belief_data["belief"],
-        "message_to_agent_1": belief_data["message_to_agent_1"]
-    }
-
-
-# ============================================================================
-# COMMUNICATION FUNCTIONS
-# ============================================================================
-
-def agent_2_reply_to_agent_1(task, agent_1_message, agent_2_belief):
-    """
-    Agent 2 creates a reply after seeing Agent 1's message, considering own belief and task context
-    """
-    reply_prompt = f"""
+# Communication turns, keyed by speaker and round (see _EXCHANGES)
+_EXCHANGE_TEMPLATE_A2_R1 = """
     You have received the following message from Agent 1:
-    "{agent_1_message}"
+    "{conversation[0]}"
 
     Context for your reply:
-    - Your initial assessment: You estimated a {agent_2_belief}% chance that collaboration would be successful
+    - Your initial assessment: You estimated a {belief}% chance that collaboration would be successful
     - Task options available:
-      * A: Upside = {task['options']['A']['upside']}, Downside = {task['options']['A']['downside']}
-      * B: Upside = {task['options']['B']['upside']}, Downside = {task['options']['B']['downside']}
-      * C: Upside = {task['options']['C']['upside']}, Downside = {task['options']['C']['downside']}
-      * Y: Guaranteed = {task['options']['Y']['guaranteed']}
+      {payoffs_table}
 
     Create a strategic reply message to Agent 1. Your reply should:
     - Not disclose your specific belief percentage
@@ -187,42 +166,17 @@ def agent_2_reply_to_agent_1(task, agent_1_message, agent_2_belief):
     {{"reply_to_agent_1": "your one line reply message to agent 1", "updated_belief": NUMBER, "predicted_other_agent_belief": NUMBER}}
     """
 
-    response = client.chat.completions.create(
-        model="gpt-5-nano",
-        messages=[
-            {"role": "developer", "content": context_prompt},
-            {"role": "user", "content": reply_prompt}
-        ],
-    )
-
-    reply_text = response.choices[0].message.content.strip()
-    print(f"Reply response : {reply_text}".encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
-    reply_data = json.loads(reply_text)
-
-    return {
-        "reply_to_agent_1": reply_data["reply_to_agent_1"],
-        "updated_belief": reply_data["updated_belief"],
-        "predicted_other_agent_belief": reply_data["predicted_other_agent_belief"]
-    }
-
 
-def agent_1_reply_to_agent_2(task, agent_1_message, agent_2_reply, agent_1_belief):
-    """
-    Agent 1 creates a reply after seeing Agent 2's reply, knowing the conversation history
-    """
-    reply_prompt = f"""
+_EXCHANGE_TEMPLATE_A1_R1 = """
     You are continuing a conversation with Agent 2. Here is the conversation so far:
 
-    Your initial message: "{agent_1_message}"
-    Agent 2's reply: "{agent_2_reply}"
+    Your initial message: "{conversation[0]}"
+    Agent 2's reply: "{conversation[1]}"
 
     Context for your reply:
-    - Your own assessment: You estimated a {agent_1_belief}% chance that collaboration would be successful
+    - Your own assessment: You estimated a {belief}% chance that collaboration would be successful
     - Task options available:
-      * A: Upside = {task['options']['A']['upside']}, Downside = {task['options']['A']['downside']}
-      * B: Upside = {task['options']['B']['upside']}, Downside = {task['options']['B']['downside']}
-      * C: Upside = {task['options']['C']['upside']}, Downside = {task['options']['C']['downside']}
-      * Y: Guaranteed = {task['options']['Y']['guaranteed']}
+      {payoffs_table}
 
     Create a strategic follow-up message to Agent 2. Your reply should:
     - Not disclose your specific belief percentage
@@ -241,45 +195,20 @@ def agent_1_reply_to_agent_2(task, agent_1_message, agent_2_reply, agent_1_belie
     {{"reply_to_agent_2": "your one line reply message to agent 2", "updated_belief": NUMBER, "predicted_other_agent_belief": NUMBER}}
     """
 
-    response = client.chat.completions.create(
-        model="gpt-5-nano",
-        messages=[
-            {"role": "developer", "content": context_prompt},
-            {"role": "user", "content": reply_prompt}
-        ],
-    )
-
-    reply_text = response.choices[0].message.content.strip()
-    print(f"Reply response : {reply_text}".encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
-    reply_data = json.loads(reply_text)
-
-    return {
-        "reply_to_agent_2": reply_data["reply_to_agent_2"],
-        "updated_belief": reply_data["updated_belief"],
-        "predicted_other_agent_belief": reply_data["predicted_other_agent_belief"]
-    }
-
 
-def agent_2_second_reply_to_agent_1(task, agent_1_message, agent_2_first_reply, agent_1_reply, agent_2_belief, agent_2_previous_prediction):
-    """
-    Agent 2 creates a second reply after seeing Agent 1's follow-up, knowing the full conversation history
-    """
-    reply_prompt = f"""
+_EXCHANGE_TEMPLATE_A2_R2 = """
     You are continuing a conversation with Agent 1. Here is the conversation so far:
 
-    Agent 1's initial message: "{agent_1_message}"
-    Your first reply: "{agent_2_first_reply}"
-    Agent 1's follow-up: "{agent_1_reply}"
+    Agent 1's initial message: "{conversation[0]}"
+    Your first reply: "{conversation[1]}"
+    Agent 1's follow-up: "{conversation[2]}"
 
     Context for your reply:
-    - Your current belief: You currently believe there is a {agent_2_belief}% chance that collaboration would be successful
-    - Your previous prediction: After your first reply, you estimated Agent 1's belief was {agent_2_previous_prediction}%
+    - Your current belief: You currently believe there is a {belief}% chance that collaboration would be successful
+    - Your previous prediction: After your first reply, you estimated Agent 1's belief was {previous_prediction}%
       (You can compare this with Agent 1's actual follow-up message to adjust your strategy)
     - Task options available:
-      * A: Upside = {task['options']['A']['upside']}, Downside = {task['options']['A']['downside']}
-      * B: Upside = {task['options']['B']['upside']}, Downside = {task['options']['B']['downside']}
-      * C: Upside = {task['options']['C']['upside']}, Downside = {task['options']['C']['downside']}
-      * Y: Guaranteed = {task['options']['Y']['guaranteed']}
+      {payoffs_table}
 
     Create a strategic follow-up message to Agent 1. Your reply should:
     - Not disclose your specific belief percentage
@@ -300,46 +229,21 @@ def agent_2_second_reply_to_agent_1(task, agent_1_message, agent_2_first_reply,
     {{"reply_to_agent_1": "your one line reply message to agent 1", "updated_belief": NUMBER, "predicted_other_agent_belief": NUMBER}}
     """
 
-    response = client.chat.completions.create(
-        model="gpt-5-nano",
-        messages=[
-            {"role": "developer", "content": context_prompt},
-            {"role": "user", "content": reply_prompt}
-        ],
-    )
-
-    reply_text = response.choices[0].message.content.strip()
-    print(f"Reply response : {reply_text}".encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
-    reply_data = json.loads(reply_text)
-
-    return {
-        "reply_to_agent_1": reply_data["reply_to_agent_1"],
-        "updated_belief": reply_data["updated_belief"],
-        "predicted_other_agent_belief": reply_data["predicted_other_agent_belief"]
-    }
-
 
-def agent_1_third_message_to_agent_2(task, agent_1_message, agent_2_first_reply, agent_1_second_message, agent_2_second_reply, agent_1_belief, agent_1_previous_prediction):
-    """
-    Agent 1 creates a third message after seeing Agent 2's second reply, knowing the full conversation history
-    """
-    reply_prompt = f"""
+_EXCHANGE_TEMPLATE_A1_R2 = """
     You are continuing a conversation with Agent 2. Here is the conversation so far:
 
-    Your initial message: "{agent_1_message}"
-    Agent 2's first reply: "{agent_2_first_reply}"
-    Your second message: "{agent_1_second_message}"
-    Agent 2's second reply: "{agent_2_second_reply}"
+    Your initial message: "{conversation[0]}"
+    Agent 2's first reply: "{conversation[1]}"
+    Your second message: "{conversation[2]}"
+    Agent 2's second reply: "{conversation[3]}"
 
     Context for your reply:
-    - Your current belief: You currently believe there is a {agent_1_belief}% chance that collaboration would be successful
-    - Your previous prediction: After your second message, you estimated Agent 2's belief was {agent_1_previous_prediction}%
+    - Your current belief: You currently believe there is a {belief}% chance that collaboration would be successful
+    - Your previous prediction: After your second message, you estimated Agent 2's belief was {previous_prediction}%
       (You can compare this with Agent 2's actual second reply to adjust your strategy)
     - Task options available:
-      * A: Upside = {task['options']['A']['upside']}, Downside = {task['options']['A']['downside']}
-      * B: Upside = {task['options']['B']['upside']}, Downside = {task['options']['B']['downside']}
-      * C: Upside = {task['options']['C']['upside']}, Downside = {task['options']['C']['downside']}
-      * Y: Guaranteed = {task['options']['Y']['guaranteed']}
+      {payoffs_table}
 
     Create a strategic third message to Agent 2. Your message should:
     - Not disclose your specific belief percentage
@@ -360,47 +264,22 @@ def agent_1_third_message_to_agent_2(task, agent_1_message, agent_2_first_reply,
     {{"message_to_agent_2": "your one line message to agent 2", "updated_belief": NUMBER, "predicted_other_agent_belief": NUMBER}}
     """
 
-    response = client.chat.completions.create(
-        model="gpt-5-nano",
-        messages=[
-            {"role": "developer", "content": context_prompt},
-            {"role": "user", "content": reply_prompt}
-        ],
-    )
-
-    reply_text = response.choices[0].message.content.strip()
-    print(f"Reply response : {reply_text}".encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
-    reply_data = json.loads(reply_text)
-
-    return {
-        "message_to_agent_2": reply_data["message_to_agent_2"],
-        "updated_belief": reply_data["updated_belief"],
-        "predicted_other_agent_belief": reply_data["predicted_other_agent_belief"]
-    }
-
 
-def agent_2_third_reply_to_agent_1(task, agent_1_message, agent_2_first_reply, agent_1_second_message, agent_2_second_reply, agent_1_third_message, agent_2_belief, agent_2_previous_prediction):
-    """
-    Agent 2 creates a third reply after seeing Agent 1's third message, knowing the full conversation history
-    """
-    reply_prompt = f"""
+_EXCHANGE_TEMPLATE_A2_R3 = """
     You are continuing a conversation with Agent 1. Here is the complete conversation so far:
 
-    Agent 1's initial message: "{agent_1_message}"
-    Your first reply: "{agent_2_first_reply}"
-    Agent 1's second message: "{agent_1_second_message}"
-    Your second reply: "{agent_2_second_reply}"
-    Agent 1's third message: "{agent_1_third_message}"
+    Agent 1's initial message: "{conversation[0]}"
+    Your first reply: "{conversation[1]}"
+    Agent 1's second message: "{conversation[2]}"
+    Your second reply: "{conversation[3]}"
+    Agent 1's third message: "{conversation[4]}"
 
     Context for your reply:
-    - Your current belief: You currently believe there is a {agent_2_belief}% chance that collaboration would be successful
-    - Your previous prediction: After your second reply, you estimated Agent 1's belief was {agent_2_previous_prediction}%
+    - Your current belief: You currently believe there is a {belief}% chance that collaboration would be successful
+    - Your previous prediction: After your second reply, you estimated Agent 1's belief was {previous_prediction}%
       (You can compare this with Agent 1's actual third message to adjust your strategy)
     - Task options available:
-      * A: Upside = {task['options']['A']['upside']}, Downside = {task['options']['A']['downside']}
-      * B: Upside = {task['options']['B']['upside']}, Downside = {task['options']['B']['downside']}
-      * C: Upside = {task['options']['C']['upside']}, Downside = {task['options']['C']['downside']}
-      * Y: Guaranteed = {task['options']['Y']['guaranteed']}
+      {payoffs_table}
 
     Create your final strategic message to Agent 1. Your reply should:
     - Not disclose your specific belief percentage
@@ -421,25 +300,385 @@ def agent_2_third_reply_to_agent_1(task, agent_1_message, agent_2_first_reply, a
     {{"reply_to_agent_1": "your one line reply message to agent 1", "updated_belief": NUMBER, "predicted_other_agent_belief": NUMBER}}
     """
 
-    response = client.chat.completions.create(
-        model="gpt-5-nano",
-        messages=[
-            {"role": "developer", "content": context_prompt},
-            {"role": "user", "content": reply_prompt}
-        ],
-    )
 
-    reply_text = response.choices[0].message.content.strip()
-    print(f"Reply response : {reply_text}".encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
-    reply_data = json.loads(reply_text)
+
+# ============================================================================
+# LLM CALLS
+# ============================================================================
+
+_cache_db = None
+_cache_memory = OrderedDict()
+if CACHE_MODE != "off":
+    _cache_db = sqlite3.connect(CACHE_DB)
+    _cache_db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, response BLOB)")
+    atexit.register(_cache_db.close)
+
+
+# ID of the trial running in the current task (see new_trial_id)
+_current_trial = contextvars.ContextVar("current_trial", default=None)
+
+
+def new_trial_id():
+    """
+    Trial IDs are the process's RUN_ID plus a monotonic counter, so trials within a run
+    stay in order and never collide with another process that has a different RUN_ID
+    """
+    return f"{RUN_ID}-{next(_trial_counter):04x}"
+
+
+def cache_key(messages):
+    """Hash of everything that determines a response: model, messages and the trial asking"""
+    payload = json.dumps([MODEL_NAME, messages, _current_trial.get()], sort_keys=True)
+    return hashlib.blake2b(payload.encode("utf-8")).hexdigest()
+
+
+def _remember(key, text):
+    """Keep key in the in-memory tier as most recently used, evicting the oldest entry when full"""
+    _cache_memory[key] = text
+    _cache_memory.move_to_end(key)
+    if len(_cache_memory) > CACHE_MEMORY_ENTRIES:
+        _cache_memory.popitem(last=False)
+
+
+def cache_get(key):
+    """Return the cached response text for key (memory first, then the database), or None on a miss"""
+    if key in _cache_memory:
+        _cache_memory.move_to_end(key)
+        return _cache_memory[key]
+    row = _cache_db.execute("SELECT response FROM cache WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    text = row[0].decode("utf-8")
+    _remember(key, text)
+    return text
+
+
+def cache_put(key, text):
+    """Store a response text under key in both tiers, replacing any earlier entry"""
+    _remember(key, text)
+    _cache_db.execute("INSERT OR REPLACE INTO cache (key, response) VALUES (?, ?)", (key, text.encode("utf-8")))
+    _cache_db.commit()
+
+
+class JsonObjectTracker:
+    """
+    Follows brace depth across streamed chunks (ignoring braces inside strings) to find
+    where the first top-level JSON object in a response closes
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, chunk):
+        """Return the index just past the object's closing brace in chunk, or None while it is still open"""
+        for i, ch in enumerate(chunk):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == "{":
+                self.depth += 1
+            elif self.depth:
+                if ch == '"':
+                    self.in_string = True
+                elif ch == "}":
+                    self.depth -= 1
+                    if self.depth == 0:
+                        return i + 1
+        return None
+
+
+class BatchCollector:
+    """
+    Collects chat requests from concurrently running trials and submits them together
+    as one Batch API job, resolving each caller once the job's output is available
+    """
+
+    def __init__(self):
+        self.pending = []  # (custom_id, request body, future)
+        self.timer = None
+        self.submitted = 0
+        self.batch_tasks = set()  # In-flight run_batch tasks; the loop itself only keeps weak references
+
+    async def complete(self, messages):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        body = {"model": MODEL_NAME, "messages": messages}
+        self.pending.append((f"req-{self.submitted + len(self.pending)}", body, future))
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = loop.call_later(BATCH_COLLECT_SECONDS, self.flush)
+        return await future
+
+    def flush(self):
+        requests, self.pending, self.timer = self.pending, [], None
+        self.submitted += len(requests)
+        task = asyncio.ensure_future(self.run_batch(requests))
+        self.batch_tasks.add(task)
+        task.add_done_callback(self.batch_tasks.discard)
+
+    async def run_batch(self, requests):
+        futures = {custom_id: future for custom_id, _, future in requests}
+        try:
+            lines = [
+                json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body})
+                for custom_id, body, _ in requests
+            ]
+            batch_file = await client.files.create(file=("batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch")
+            batch = await client.batches.create(
+                input_file_id=batch_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h",
+            )
+            print(f"Submitted batch {batch.id} ({len(requests)} requests)")
+            while batch.status not in ("completed", "failed", "expired", "cancelled"):
+                await asyncio.sleep(BATCH_POLL_SECONDS)
+                batch = await client.batches.retrieve(batch.id)
+            if batch.output_file_id is None:
+                raise RuntimeError(f"Batch {batch.id} ended with status {batch.status!r} and no output")
+
+            output = await client.files.content(batch.output_file_id)
+            for line in output.text.splitlines():
+                result = json.loads(line)
+                future = futures.pop(result["custom_id"])
+                if result.get("error") or result["response"]["status_code"] != 200:
+                    future.set_exception(RuntimeError(f"Batch request failed: {result.get('error') or result['response']}"))
+                else:
+                    future.set_result(result["response"]["body"]["choices"][0]["message"]["content"].strip())
+            if futures:
+                raise RuntimeError(f"Batch {batch.id} ({batch.status}) returned no output for {len(futures)} requests")
+        except Exception as exc:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(exc)
+
+
+batch_collector = BatchCollector() if BATCH_MODE else None
+
+
+# Event-loop time at which the next online request may start (see LLM_MAX_RPM)
+_next_request_at = 0.0
+
+
+async def wait_for_request_slot():
+    """Sleep until this request's evenly spaced slot under LLM_MAX_RPM (no-op when it is unset)"""
+    global _next_request_at
+    if not MAX_REQUESTS_PER_MINUTE:
+        return
+    now = asyncio.get_running_loop().time()
+    start = max(now, _next_request_at)
+    _next_request_at = start + 60.0 / MAX_REQUESTS_PER_MINUTE
+    if start > now:
+        await asyncio.sleep(start - now)
+
+
+async def cached_completion(messages):
+    """
+    Stream the reply for messages and return its text, going through the response cache
+    when LLM_CACHE_MODE is not "off" and through the Batch API (no streaming) when
+    LLM_BATCH_MODE=1
+    """
+    key = cache_key(messages) if CACHE_MODE != "off" else None
+    if CACHE_MODE in ("read", "rw"):
+        cached = cache_get(key)
+        if cached is not None:
+            return cached
+
+    if BATCH_MODE:
+        text = await batch_collector.complete(messages)
+    else:
+        await wait_for_request_slot()
+        stream = await client.chat.completions.create(model=MODEL_NAME, messages=messages, stream=True)
+
+        # Every prompt asks for a single JSON object: stop reading (and close the stream,
+        # which cancels the rest of the generation) as soon as that object is complete
+        parts = []
+        tracker = JsonObjectTracker()
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                content = chunk.choices[0].delta.content
+                end = tracker.feed(content)
+                if end is not None:
+                    parts.append(content[:end])
+                    await stream.close()
+                    break
+                parts.append(content)
+        text = "".join(parts).strip()
+
+    if CACHE_MODE in ("write", "rw"):
+        cache_put(key, text)
+    return text
+
+
+async def complete_json(prompt, label):
+    """
+    Send one user prompt after the shared developer message, print the reply under label
+    and return it parsed. Replies are a few hundred bytes, so stdlib json is not the bottleneck
+    """
+    text = await cached_completion([DEVELOPER_MESSAGE, {"role": "user", "content": prompt}])
+    safe_print(f"{label} response : {text}")
+    return json.loads(text)
+
+
+# ============================================================================
+# TASK CREATION
+# ============================================================================
+
+def format_payoffs_table(options, indent="      ", bullet="*"):
+    """
+    Render an option table as prompt lines, e.g. "* A: Upside = 111, Downside = -90" / "* Y: Guaranteed = 50"
+    """
+    lines = []
+    for label, option in options.items():
+        if "guaranteed" in option:
+            lines.append(f"{bullet} {label}: Guaranteed = {option['guaranteed']}")
+        else:
+            lines.append(f"{bullet} {label}: Upside = {option['upside']}, Downside = {option['downside']}")
+    return f"\n{indent}".join(lines)
+
+
+TASK_OPTIONS = {
+    "A": {"upside": 111, "downside": -90},
+    "B": {"upside": 92, "downside": -45},
+    "C": {"upside": 77, "downside": -15},
+    "Y": {"guaranteed": 50}
+}
+# The options never change between trials, so the exchange prompts' table is rendered once
+EXCHANGE_TABLE = format_payoffs_table(TASK_OPTIONS)
+
+
+def create_task(task_id, u_value):
+    """
+    Creating a task with a given u_value and a payoff structure
+    """
+    return {
+        "task_id": task_id,
+        "options": TASK_OPTIONS,
+        "exchange_table": EXCHANGE_TABLE,
+        "u_value": u_value
+    }
+
+
+# ============================================================================
+# BELIEF FORMATION FUNCTIONS
+# ============================================================================
+
+async def run_first_agent_belief(task):
+    """
+    Running the first agent to get its belief about the task
+    """
+    belief_prompt = f"""
+    Your task to evaluate tasks based on their payoff structures.
+
+    Here is the task you need to evaluate:
+
+    Task ID: {task['task_id']}
+    Options:
+    - A: Upside = {task['options']['A']['upside']}, Downside = {task['options']['A']['downside']}
+    - B: Upside = {task['options']['B']['upside']}, Downside = {task['options']['B']['downside']}
+    - C: Upside = {task['options']['C']['upside']}, Downside = {task['options']['C']['downside']}
+    - Y: Guaranteed = {task['options']['Y']['guaranteed']}
+
+    What is your assessment of the likelihood(belief) (0-100) that collaboration would be successful in this specific task?
+    Also, provide a brief explanation of your reasoning and I want you to not disclose the option that the you are considering, but rather communicate whether the you want to collaborate or not. You also have the choice to negotiate with the other agent - to convince the other agent to choose collaboration or individual action according to your payoff structure.
+
+    Respond in JSON format as follows:
+    {{"belief": NUMBER, "reasoning": "brief explanation of how you arrived at this belief based on the context and options.", "message_to_agent_2": "one line message to agent 2"}}
+    """
+
+    belief_data = await complete_json(belief_prompt, "Belief")
+
+    return {
+        "belief": belief_data["belief"],
+        "message_to_agent_2": belief_data["message_to_agent_2"]
+    }
+
+
+async def run_second_agent_belief(task):
+    """
+    Running the second agent to get its belief about the task
+    """
+    belief_prompt = f"""
+    Your task to evaluate tasks based on their payoff structures and give out an assessment of the likelihood(belief) (0-100) that collaboration would be successful in this specific task.
+    Here is the task you need to evaluate:
+
+    Task ID: {task['task_id']}
+    Options:
+    - A: Upside = {task['options']['A']['upside']}, Downside = {task['options']['A']['downside']}
+    - B: Upside = {task['options']['B']['upside']}, Downside = {task['options']['B']['downside']}
+    - C: Upside = {task['options']['C']['upside']}, Downside = {task['options']['C']['downside']}
+    - Y: Guaranteed = {task['options']['Y']['guaranteed']}
+
+    What is your assessment of the likelihood(belief) (0-100) that collaboration would be successful in this specific task?
+    Also, provide a brief explanation of your reasoning and I want you to not disclose the option that the you are considering, but rather communicate whether the you want to collaborate or not. You also have the choice to negotiate with the other agent - to convince the other agent to choose collaboration or individual action according to your payoff structure.
+
+    Respond in JSON format as follows:
+    {{"belief": NUMBER, "reasoning": "brief explanation of how you arrived at this belief based on the context and options.", "message_to_agent_1": "one line message to agent 1"}}
+    """
+
+    belief_data = await complete_json(belief_prompt, "Belief")
 
     return {
-        "reply_to_agent_1": reply_data["reply_to_agent_1"],
-        "updated_belief": reply_data["updated_belief"],
-        "predicted_other_agent_belief": reply_data["predicted_other_agent_belief"]
+        "belief": belief_data["belief"],
+        "message_to_agent_1": belief_data["message_to_agent_1"]
     }
 
 
+# ============================================================================
+# COMMUNICATION FUNCTIONS
+# ============================================================================
+
+# (agent_id, round_idx) -> (prompt template, JSON key carrying the outgoing message, heading).
+# Turns run in this order and each answers the one before it
+_EXCHANGES = {
+    (2, 1): (_EXCHANGE_TEMPLATE_A2_R1, "reply_to_agent_1", "Agent 2's First Reply"),
+    (1, 1): (_EXCHANGE_TEMPLATE_A1_R1, "reply_to_agent_2", "Agent 1's Second Message"),
+    (2, 2): (_EXCHANGE_TEMPLATE_A2_R2, "reply_to_agent_1", "Agent 2's Second Reply"),
+    (1, 2): (_EXCHANGE_TEMPLATE_A1_R2, "message_to_agent_2", "Agent 1's Third Message"),
+    (2, 3): (_EXCHANGE_TEMPLATE_A2_R3, "reply_to_agent_1", "Agent 2's Third Reply"),
+}
+
+
+@dataclass(frozen=True)
+class AgentState:
+    """
+    What one agent carries into its next turn: its current belief and its latest prediction
+    of the partner's belief (None before its first exchange)
+    """
+    belief: int
+    prediction: int | None = None
+
+
+async def agent_exchange(agent_id, round_idx, task, conversation, state):
+    """
+    One communication turn: the agent reads the conversation so far and writes its next message
+
+    conversation holds every message exchanged so far, oldest first (Agent 1 speaks first).
+    It is append-only: earlier messages are never edited or reordered, so each turn's
+    prompt quotes them exactly as they were first sent. Each turn is one stateless request
+    rather than a running multi-turn or tool-call thread per agent, which keeps turns
+    replayable from the cache and submittable through the Batch API.
+    Agent 2 replies in rounds 1-3, Agent 1 follows up in rounds 1-2.
+    Returns the message and the agent's state after the turn.
+    """
+    template, message_key, _ = _EXCHANGES[(agent_id, round_idx)]
+    reply_prompt = template.format(
+        conversation=conversation,
+        belief=state.belief,
+        previous_prediction=state.prediction,
+        payoffs_table=task['exchange_table'],
+    )
+
+    reply_data = await complete_json(reply_prompt, "Reply")
+
+    return reply_data[message_key], AgentState(reply_data["updated_belief"], reply_data["predicted_other_agent_belief"])
+
+
 def communication_channel(agent1_message, agent2_first_reply, agent1_second_message, agent2_second_reply, agent1_third_message, agent2_third_reply):
     """
     Communication channel where both agents can see the complete interactive exchange
@@ -462,10 +701,15 @@ def communication_channel(agent1_message, agent2_first_reply, agent1_second_mess
 # DECISION MAKING FUNCTIONS
 # ============================================================================
 
-def run_first_agent_decision(task, agent1_belief, agent2_belief, agent1_updated_belief, agent1_predicted_agent2_belief, agent1_message, agent2_first_reply, agent1_second_message, agent2_second_reply, agent1_third_message, agent2_third_reply):
+# The decision prompts quote all six messages verbatim. The conversation is the manipulation
+# whose effect on the choice is being measured, so it is not condensed into a summary of
+# beliefs and the last reply; that would change the stimulus, not just its token count
+
+async def run_first_agent_decision(task, conversation, agent1_belief, agent2_belief, agent1_updated_belief, agent1_predicted_agent2_belief):
     """
     Running the first agent to make a decision about the task with full communication history
     """
+    agent1_message, agent2_first_reply, agent1_second_message, agent2_second_reply, agent1_third_message, agent2_third_reply = conversation
     decision_prompt = f"""
     Your task is to make a decision about the given task based on its payoff structures and the u_value.
 
@@ -497,17 +741,7 @@ def run_first_agent_decision(task, agent1_belief, agent2_belief, agent1_updated_
 
     Respond in JSON format: {{"choice": "A"/"B"/"C"/"Y", "strategy": "collaborative"/"individual", "reasoning": "your explanation"}}"""
 
-    response = client.chat.completions.create(
-        model="gpt-5-nano",
-        messages=[
-            {"role": "developer", "content": context_prompt},
-            {"role": "user", "content": decision_prompt}
-        ],
-    )
-
-    decision_text = response.choices[0].message.content.strip()
-    print(f"Decision response : {decision_text}".encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
-    decision_data = json.loads(decision_text)
+    decision_data = await complete_json(decision_prompt, "Decision")
 
     return {
         "choice": decision_data["choice"],
@@ -516,10 +750,11 @@ def run_first_agent_decision(task, agent1_belief, agent2_belief, agent1_updated_
     }
 
 
-def run_second_agent_decision(task, agent2_belief, agent1_belief, agent2_updated_belief, agent2_predicted_agent1_belief, agent1_message, agent2_first_reply, agent1_second_message, agent2_second_reply, agent1_third_message, agent2_third_reply):
+async def run_second_agent_decision(task, conversation, agent2_belief, agent1_belief, agent2_updated_belief, agent2_predicted_agent1_belief):
     """
     Running the second agent to make a decision about the task with full communication history
     """
+    agent1_message, agent2_first_reply, agent1_second_message, agent2_second_reply, agent1_third_message, agent2_third_reply = conversation
     decision_prompt = f"""
     Your task is to make a decision about the given task based on its payoff structures and the u_value.
 
@@ -551,17 +786,7 @@ def run_second_agent_decision(task, agent2_belief, agent1_belief, agent2_updated
 
     Respond in JSON format: {{"choice": "A"/"B"/"C"/"Y", "strategy": "collaborative"/"individual", "reasoning": "your explanation"}}"""
 
-    response = client.chat.completions.create(
-        model="gpt-5-nano",
-        messages=[
-            {"role": "developer", "content": context_prompt},
-            {"role": "user", "content": decision_prompt}
-        ]
-    )
-
-    decision_text = response.choices[0].message.content.strip()
-    print(f"Decision response : {decision_text}".encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
-    decision_data = json.loads(decision_text)
+    decision_data = await complete_json(decision_prompt, "Decision")
 
     return {
         "choice": decision_data["choice"],
@@ -574,13 +799,20 @@ def run_second_agent_decision(task, agent2_belief, agent1_belief, agent2_updated
 # UTILITY FUNCTIONS
 # ============================================================================
 
+# Output lines of the trial running in the current task (None outside a trial)
+_trial_log = contextvars.ContextVar("trial_log", default=None)
+
+
 def safe_print(text):
-    """Helper function to safely print text with Unicode characters"""
-    try:
+    """
+    Print a line of trial output. Inside a trial the line is held in that trial's log and
+    written in one piece when the trial ends, so concurrent trials do not interleave
+    """
+    log = _trial_log.get()
+    if log is None:
         print(text)
-    except UnicodeEncodeError:
-        # Fallback: encode with 'replace' to handle problematic characters
-        print(text.encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
+    elif VERBOSE:
+        log.append(f"{text}\n")
 
 
 def check_strategy_mismatch(agent1_strategy, agent2_strategy):
@@ -593,117 +825,162 @@ def check_strategy_mismatch(agent1_strategy, agent2_strategy):
     return 0
 
 
-def save_result_to_file(task, agent1_decision, agent2_decision, agent1_belief, agent2_belief, mismatch):
+# (epoch second, formatted timestamp) of the last result line
+_last_timestamp = (None, "")
+
+
+def result_timestamp():
     """
-    Append the test result to the results file
+    Local time as "YYYY-MM-DD HH:MM:SS" for a result line. Lines are stamped to the second,
+    so concurrent trials finishing in the same second reuse one formatted string
     """
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    global _last_timestamp
+    second = int(time.time())
+    if _last_timestamp[0] != second:
+        _last_timestamp = (second, datetime.fromtimestamp(second).strftime("%Y-%m-%d %H:%M:%S"))
+    return _last_timestamp[1]
+
 
-    with open(RESULTS_FILE, 'a', encoding='utf-8') as f:
-        result_line = (
-            f"{timestamp} | "
-            f"Task_ID:{task['task_id']} | "
-            f"U_Value:{task['u_value']} | "
-            f"Agent1_Belief:{agent1_belief} | "
-            f"Agent2_Belief:{agent2_belief} | "
-            f"Agent1_Choice:{agent1_decision['choice']} | "
-            f"Agent1_Strategy:{agent1_decision['strategy']} | "
-            f"Agent2_Choice:{agent2_decision['choice']} | "
-            f"Agent2_Strategy:{agent2_decision['strategy']} | "
-            f"Mismatch:{mismatch}\n"
-        )
-        f.write(result_line)
+def result_field(value):
+    """
+    Model-written values go into a " | "-delimited line: swap any pipe for the look-alike
+    U+2223 and fold line breaks, so a stray character cannot split or break the record
+    """
+    return " ".join(str(value).replace("|", "\u2223").split())
 
-    print(f"\nResult saved to {RESULTS_FILE}")
-    print(f"Mismatch: {mismatch} (1 = mismatch, 0 = no mismatch)")
+
+def save_result_to_file(results_fh, trial_id, task, agent1_decision, agent2_decision, agent1_belief, agent2_belief, mismatch):
+    """
+    Append the test result to the results file through the run's open, buffered handle
+
+    Lines keep the " | "-delimited key:value format that analyze_results.py reads and that
+    the existing results files already use, so new trials can be appended to them
+    """
+    timestamp = result_timestamp()
+
+    result_line = (
+        f"{timestamp} | "
+        f"Trial_ID:{trial_id} | "
+        f"Task_ID:{task['task_id']} | "
+        f"U_Value:{task['u_value']} | "
+        f"Agent1_Belief:{result_field(agent1_belief)} | "
+        f"Agent2_Belief:{result_field(agent2_belief)} | "
+        f"Agent1_Choice:{result_field(agent1_decision['choice'])} | "
+        f"Agent1_Strategy:{result_field(agent1_decision['strategy'])} | "
+        f"Agent2_Choice:{result_field(agent2_decision['choice'])} | "
+        f"Agent2_Strategy:{result_field(agent2_decision['strategy'])} | "
+        f"Mismatch:{mismatch}\n"
+    )
+    results_fh.write(result_line)
+
+    safe_print(f"\nMismatch: {mismatch} (1 = mismatch, 0 = no mismatch)")
 
 
 # ============================================================================
 # MAIN EXECUTION
 # ============================================================================
 
-def main():
+async def run_trial(results_fh):
+    """
+    Run one complete trial (beliefs, three exchanges, decisions) and append its result
+    """
+    trial_id = new_trial_id()
+    _current_trial.set(trial_id)
     task = create_task(task_id=1, u_value=0.95)
 
-    # Step 1: Agent 1 forms belief and sends initial message
-    print("=== Agent 1 Belief ===")
-    agent1_belief_data = run_first_agent_belief(task)
+    # Steps 1-2: Both agents form their beliefs independently, so the two calls run concurrently.
+    # Every trial sends these same two prompts, but each trial still makes its own calls rather
+    # than sharing one n=NUM_TRIALS request: the shared prefill is a few hundred tokens next to
+    # the reasoning tokens, and per-trial calls keep each belief under its own trial's cache key
+    safe_print("=== Agent 1 & Agent 2 Beliefs ===")
+    agent1_belief_data, agent2_belief_data = await asyncio.gather(
+        run_first_agent_belief(task),
+        run_second_agent_belief(task),
+    )
     agent1_belief = agent1_belief_data["belief"]
     agent1_message = agent1_belief_data["message_to_agent_2"]
-
-    # Step 2: Agent 2 forms belief and sends first reply
-    print("\n=== Agent 2 Belief ===")
-    agent2_belief_data = run_second_agent_belief(task)
     agent2_belief = agent2_belief_data["belief"]
     agent2_initial_message = agent2_belief_data["message_to_agent_1"]
 
-    print("\n=== Agent 2's First Reply ===")
-    agent2_first_reply_data = agent_2_reply_to_agent_1(task, agent1_message, agent2_belief)
-    agent2_first_reply = agent2_first_reply_data["reply_to_agent_1"]
-    agent2_updated_belief_1 = agent2_first_reply_data["updated_belief"]
-    agent2_predicted_agent1_belief_1 = agent2_first_reply_data["predicted_other_agent_belief"]
-    safe_print(f"\n[Agent 2 After Exchange 1]")
-    safe_print(f"  Updated Belief: {agent2_updated_belief_1}%")
-    safe_print(f"  Predicted Agent 1's Belief: {agent2_predicted_agent1_belief_1}%")
-
-    # Step 3: Agent 1 sends second message
-    print("\n=== Agent 1's Second Message ===")
-    agent1_second_message_data = agent_1_reply_to_agent_2(task, agent1_message, agent2_first_reply, agent1_belief)
-    agent1_second_message = agent1_second_message_data["reply_to_agent_2"]
-    agent1_updated_belief_1 = agent1_second_message_data["updated_belief"]
-    agent1_predicted_agent2_belief_1 = agent1_second_message_data["predicted_other_agent_belief"]
-    safe_print(f"\n[Agent 1 After Exchange 1]")
-    safe_print(f"  Updated Belief: {agent1_updated_belief_1}%")
-    safe_print(f"  Predicted Agent 2's Belief: {agent1_predicted_agent2_belief_1}%")
-
-    # Step 4: Agent 2 sends second reply (using updated belief from first exchange and previous prediction)
-    print("\n=== Agent 2's Second Reply ===")
-    agent2_second_reply_data = agent_2_second_reply_to_agent_1(task, agent1_message, agent2_first_reply, agent1_second_message, agent2_updated_belief_1, agent2_predicted_agent1_belief_1)
-    agent2_second_reply = agent2_second_reply_data["reply_to_agent_1"]
-    agent2_updated_belief_2 = agent2_second_reply_data["updated_belief"]
-    agent2_predicted_agent1_belief_2 = agent2_second_reply_data["predicted_other_agent_belief"]
-    safe_print(f"\n[Agent 2 After Exchange 2]")
-    safe_print(f"  Updated Belief: {agent2_updated_belief_2}%")
-    safe_print(f"  Predicted Agent 1's Belief: {agent2_predicted_agent1_belief_2}%")
-
-    # Step 5: Agent 1 sends third message (using updated belief from first exchange and previous prediction)
-    print("\n=== Agent 1's Third Message ===")
-    agent1_third_message_data = agent_1_third_message_to_agent_2(task, agent1_message, agent2_first_reply, agent1_second_message, agent2_second_reply, agent1_updated_belief_1, agent1_predicted_agent2_belief_1)
-    agent1_third_message = agent1_third_message_data["message_to_agent_2"]
-    agent1_updated_belief_2 = agent1_third_message_data["updated_belief"]
-    agent1_predicted_agent2_belief_2 = agent1_third_message_data["predicted_other_agent_belief"]
-    safe_print(f"\n[Agent 1 After Exchange 2]")
-    safe_print(f"  Updated Belief: {agent1_updated_belief_2}%")
-    safe_print(f"  Predicted Agent 2's Belief: {agent1_predicted_agent2_belief_2}%")
-
-    # Step 6: Agent 2 sends third reply (using updated belief from second exchange and previous prediction)
-    print("\n=== Agent 2's Third Reply ===")
-    agent2_third_reply_data = agent_2_third_reply_to_agent_1(task, agent1_message, agent2_first_reply, agent1_second_message, agent2_second_reply, agent1_third_message, agent2_updated_belief_2, agent2_predicted_agent1_belief_2)
-    agent2_third_reply = agent2_third_reply_data["reply_to_agent_1"]
-    agent2_updated_belief_3 = agent2_third_reply_data["updated_belief"]
-    agent2_predicted_agent1_belief_3 = agent2_third_reply_data["predicted_other_agent_belief"]
-    safe_print(f"\n[Agent 2 After Exchange 3]")
-    safe_print(f"  Updated Belief: {agent2_updated_belief_3}%")
-    safe_print(f"  Predicted Agent 1's Belief: {agent2_predicted_agent1_belief_3}%")
+    # Every message exchanged so far, oldest first; turns only ever append to it
+    conversation = [agent1_message]
+    states = {1: AgentState(agent1_belief), 2: AgentState(agent2_belief)}
+
+    # Steps 3-6: the agents take turns; each turn starts from the speaker's state after its
+    # previous turn (updated belief and prediction of the partner's belief). Unlike the belief
+    # and decision pairs these calls are not gathered: every turn quotes the message before it
+    for (agent_id, round_idx), (_, _, heading) in _EXCHANGES.items():
+        safe_print(f"\n=== {heading} ===")
+        message, states[agent_id] = await agent_exchange(agent_id, round_idx, task, conversation, states[agent_id])
+        conversation.append(message)
+        safe_print(f"\n[Agent {agent_id} After Exchange {round_idx}]")
+        safe_print(f"  Updated Belief: {states[agent_id].belief}%")
+        safe_print(f"  Predicted Agent {3 - agent_id}'s Belief: {states[agent_id].prediction}%")
 
     # Display complete communication channel
-    communication_channel(agent1_message, agent2_first_reply, agent1_second_message, agent2_second_reply, agent1_third_message, agent2_third_reply)
-
-    # Step 7: Both agents make decisions with full conversation history
-    print("=== Agent 1 Decision ===")
-    agent1_decision = run_first_agent_decision(task, agent1_belief, agent2_belief, agent1_updated_belief_2, agent1_predicted_agent2_belief_2, agent1_message, agent2_first_reply, agent1_second_message, agent2_second_reply, agent1_third_message, agent2_third_reply)
-
-    print("\n=== Agent 2 Decision ===")
-    agent2_decision = run_second_agent_decision(task, agent2_belief, agent1_belief, agent2_updated_belief_3, agent2_predicted_agent1_belief_3, agent1_message, agent2_first_reply, agent1_second_message, agent2_second_reply, agent1_third_message, agent2_third_reply)
+    communication_channel(*conversation)
+
+    # Step 7: Both agents make decisions with full conversation history; neither sees the
+    # other's decision, so the two calls run concurrently
+    safe_print("=== Agent 1 & Agent 2 Decisions ===")
+    agent1_decision, agent2_decision = await asyncio.gather(
+        run_first_agent_decision(task, conversation, agent1_belief, agent2_belief, states[1].belief, states[1].prediction),
+        run_second_agent_decision(task, conversation, agent2_belief, agent1_belief, states[2].belief, states[2].prediction),
+    )
 
-    print("\nFinal Decisions:")
+    safe_print("\nFinal Decisions:")
     safe_print(f"Agent 1 chose {agent1_decision['choice']} ({agent1_decision['strategy']}) - Reasoning: {agent1_decision['reasoning']}")
     safe_print(f"Agent 2 chose {agent2_decision['choice']} ({agent2_decision['strategy']}) - Reasoning: {agent2_decision['reasoning']}")
 
     # Check for strategy mismatch and save results
     mismatch = check_strategy_mismatch(agent1_decision['strategy'], agent2_decision['strategy'])
-    save_result_to_file(task, agent1_decision, agent2_decision, agent1_belief, agent2_belief, mismatch)
+    save_result_to_file(results_fh, trial_id, task, agent1_decision, agent2_decision, agent1_belief, agent2_belief, mismatch)
+
+
+async def main():
+    print(f"Run ID: {RUN_ID}")
+
+    # Keep one buffered handle open for the whole run instead of reopening the file per trial;
+    # closing at exit (including Ctrl+C) flushes whatever is still buffered
+    results_fh = open(RESULTS_FILE, 'a', encoding='utf-8', buffering=1 << 20)
+    atexit.register(results_fh.close)
+
+    # In batch mode every trial has to be in flight so each stage fills a single batch
+    semaphore = asyncio.Semaphore(NUM_TRIALS if BATCH_MODE else MAX_CONCURRENT_TRIALS)
+    completed = 0
+
+    async def run_bounded():
+        # Calls inside a trial stay sequential (each turn needs the previous one);
+        # independent trials overlap up to MAX_CONCURRENT_TRIALS at a time
+        nonlocal completed
+        async with semaphore:
+            log = []
+            _trial_log.set(log)
+            try:
+                await run_trial(results_fh)
+            finally:
+                sys.stdout.write("".join(log))
+        completed += 1
+        if completed % RESULTS_FLUSH_EVERY == 0:
+            results_fh.flush()
+
+    # Each trial writes its result line the moment it finishes (flushed every RESULTS_FLUSH_EVERY),
+    # so gather holds nothing but a None or an exception per trial and no result waits on the
+    # slowest trial; a run cut short keeps every trial that completed
+    try:
+        outcomes = await asyncio.gather(*(run_bounded() for _ in range(NUM_TRIALS)), return_exceptions=True)
+    finally:
+        await client.close()
+
+    failures = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+    for failure in failures:
+        print("\nTrial failed:")
+        traceback.print_exception(failure)
+
+    print(f"\n{NUM_TRIALS - len(failures)} result(s) saved to {RESULTS_FILE}")
+    if failures:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
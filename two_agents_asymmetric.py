@@ -1,29 +1,123 @@
 """
 Working with two agents
 """
+import asyncio
+import atexit
+import hashlib
+import importlib.util
+import itertools
 import json
 import sys
 import random
 import os
-from openai import OpenAI
+import sqlite3
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+import httpx
+import numpy as np
+from openai import AsyncOpenAI
 from datetime import datetime
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Write stdout as UTF-8 once at startup (Windows consoles default to cp1252), so
+# response text can be printed directly without transcoding it on every call
+sys.stdout.reconfigure(encoding="utf-8", errors="replace")
+
 # ============================================================================
 # CONSTANTS AND CONFIGURATION
 # ============================================================================
 
-RESULTS_FILE = "experiment_results_asymmetric.txt"
+# Set LLM_RESULTS_FILE to keep a run (e.g. a different model) out of the default results file
+RESULTS_FILE = os.getenv("LLM_RESULTS_FILE", "experiment_results_asymmetric.txt")
+# LLM_MODEL swaps the model for a whole run, e.g. a local vLLM server reached through
+# OPENAI_BASE_URL (read by the OpenAI client). Both agents always use the same model, and a
+# different model is a different experimental condition, so give it its own LLM_RESULTS_FILE
+MODEL_NAME = os.getenv("LLM_MODEL", "gpt-5-nano")
+NUM_TRIALS = int(os.getenv("LLM_NUM_TRIALS", "1"))  # Trials per invocation (run_experiments_asymmetric.py launches the script repeatedly)
+# Trials whose dialogues run at the same time (each has at most two calls in flight), so this
+# bounds concurrent requests to twice its value. Size it to the account tier with
+# LLM_MAX_CONCURRENT_TRIALS: raise it on higher tiers, lower it if runs start hitting 429s
+MAX_CONCURRENT_TRIALS = int(os.getenv("LLM_MAX_CONCURRENT_TRIALS", "10"))
+RESULTS_FLUSH_EVERY = 50  # Flush buffered result lines to disk every N trials
+
+# Every call has a bounded output budget so a runaway generation cannot stall a trial.
+# gpt-5-nano is a reasoning model: the cap also covers its hidden reasoning tokens (so it
+# cannot be as tight as the ~100 visible tokens of a JSON reply), and it accepts neither
+# stop sequences nor a non-default temperature. Belief calls are the simplest and get less.
+MAX_COMPLETION_TOKENS = 4096
+BELIEF_MAX_COMPLETION_TOKENS = 2048
+# Optional reasoning_effort (minimal/low/medium/high). Unset keeps the model default, since
+# less reasoning also changes how the agents behave
+REASONING_EFFORT = os.getenv("LLM_REASONING_EFFORT")
+
+# Response cache keyed by a hash of (model, messages, call options), for replaying or
+# resuming runs without paying for identical calls again:
+#   "off"   - always call the API (default; every trial samples fresh responses)
+#   "read"  - replay cached responses, call the API on a miss without storing it
+#   "write" - always call the API and record the responses
+#   "rw"    - replay hits, call the API and record on a miss
+CACHE_MODE = os.getenv("LLM_CACHE_MODE", "off")
+CACHE_DB = "llm_cache.sqlite3"
+CACHE_MEMORY_ENTRIES = 4096  # Most recently used responses also kept in memory in front of the database
+
+# Semantic fallback (LLM_SEMANTIC_CACHE=1, needs a cache mode other than "off"): on an exact
+# miss, reuse the response of a stored prompt whose embedding is nearly identical, within the
+# same stage (belief, decision, or exchange turn by agent and round) and call options. Off by default: prompts that differ only by a belief value
+# would get the same reply, which is only acceptable for development replays
+SEMANTIC_CACHE = os.getenv("LLM_SEMANTIC_CACHE") == "1" and CACHE_MODE != "off"
+SEMANTIC_CACHE_MODEL = "text-embedding-3-small"
+SEMANTIC_CACHE_MIN_COSINE = 0.985
+if CACHE_MODE not in ("off", "read", "write", "rw"):
+    raise ValueError(f"LLM_CACHE_MODE must be one of off/read/write/rw, got {CACHE_MODE!r}")
+
+# Offline sweeps (LLM_BATCH_MODE=1): every call goes through the OpenAI Batch API at half
+# price instead of online requests. All trials run at once and advance in lockstep, so each
+# dialogue stage across the whole sweep becomes one batch job (results can take up to 24h).
+# Requests are batched, never packed several trials to one prompt: each agent's reply has to
+# be an independent sample, not one of K rows the model writes side by side
+BATCH_MODE = os.getenv("LLM_BATCH_MODE") == "1"
+BATCH_COLLECT_SECONDS = 2.0  # Submit once no new request has arrived for this long
+BATCH_POLL_SECONDS = 30
+
+# Optional request-rate cap (LLM_MAX_RPM, e.g. your account tier's requests per minute):
+# online requests are spaced evenly so a burst of concurrent trials does not run into 429s
+# and the client's retry backoff. Unset means no cap beyond MAX_CONCURRENT_TRIALS
+MAX_REQUESTS_PER_MINUTE = float(os.getenv("LLM_MAX_RPM", "0"))
+
+# 8 hex chars taken straight from the top 32 bits of a uuid4 (no intermediate str(uuid)).
+# Set RUN_ID to reuse an earlier run's trial IDs (and hence its seeds and cache entries);
+# processes running side by side each need their own, which run_experiments_asymmetric.py
+# derives per run
+RUN_ID = os.getenv("RUN_ID") or f"{uuid.uuid4().int >> 96:08x}"
+_trial_counter = itertools.count(1)
 
 # Get OpenAI API key from environment variable
 OpenAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OpenAI_API_KEY:
     raise ValueError("OPENAI_API_KEY environment variable not set. Please set it in your .env file.")
 
-client = OpenAI(api_key=OpenAI_API_KEY)
+# HTTP/2 needs the optional h2 package (pip install "httpx[http2]"); without it the
+# pooled client still reuses keep-alive HTTP/1.1 connections
+HTTP2_ENABLED = importlib.util.find_spec("h2") is not None
+
+# One pooled async transport shared by every call, so concurrent trials reuse open TLS connections.
+# Every pooled connection may stay alive between turns, and a dead connect fails fast; the
+# read timeout stays generous because a reasoning model can think for a while before its
+# first streamed token
+client = AsyncOpenAI(
+    api_key=OpenAI_API_KEY,
+    http_client=httpx.AsyncClient(
+        http2=HTTP2_ENABLED,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=64),
+        timeout=httpx.Timeout(120.0, connect=5.0),
+    ),
+)
 
 context_prompt = """You are participating in an experiment as a representative of a LEGO car manufacturing company. Here's your situation:
 
@@ -44,73 +138,28 @@ GAME RULES:
 - If both choose collaborative designs (any combination), you earn the upside
 - If you choose collaborative but partner chooses individual, you get the downside"""
 
-
-# ============================================================================
-# TASK CREATION
-# ============================================================================
-
-def create_asymmetric_tasks(task_id):
-    """
-    Creating asymmetric tasks with different payoff structures and u-values for each agent
-
-    Agent 1: Options A, B, C, Y with u-value = 0.85
-    - At 85% belief, EV of collaboration = 50 (guaranteed)
-    - Payoffs designed so: 0.85 * upside + 0.15 * downside = 50
-
-    Agent 2: Options K, L, M, Y with u-value = 0.91
-    - At 91% belief, EV of collaboration = 45 (guaranteed)
-    - Payoffs designed so: 0.91 * upside + 0.09 * downside = 45
-    """
-    # Agent 1: u-value = 0.85
-    # Payoffs calculated: 0.85 * upside + 0.15 * downside = 50
-    task_agent1 = {
-        "task_id": task_id,
-        "agent_id": 1,
-        "options": {
-            "A": {"upside": 62 , "downside": -90},
-            "B": {"upside": 59, "downside": -45},
-            "C": {"upside": 55, "downside": -15},
-            "Y": {"guaranteed": 50}
-        },
-        "u_value": 0.85
-    }
-
-    # Agent 2: u-value = 0.91
-    # Payoffs calculated: 0.91 * upside + 0.09 * downside = 45
-    task_agent2 = {
-        "task_id": task_id,
-        "agent_id": 2,
-        "options": {
-            "K": {"upside": 58, "downside": -90},
-            "L": {"upside": 54, "downside": -45},
-            "M": {"upside": 51, "downside": -15},
-            "Y": {"guaranteed": 45}
-        },
-        "u_value": 0.91
-    }
-
-    return task_agent1, task_agent2
+# Every call opens with this same message object, so all calls in all dialogues share one
+# byte-identical prefix for the provider's automatic prompt cache. Per-task text (payoffs,
+# beliefs, conversation) stays in the user message, and the u-value is only ever shown
+# at the decision stage. (OpenAI only caches prefixes of 1024+ tokens and this shared prefix
+# is about 250, so the layout pays off only if the context grows; the prompt is not padded.)
+DEVELOPER_MESSAGE = {"role": "developer", "content": context_prompt}
 
 
 # ============================================================================
-# BELIEF FORMATION FUNCTIONS
+# PROMPT TEMPLATES
 # ============================================================================
 
-def run_first_agent_belief(task):
-    """
-    Running the first agent to get its belief about the task
-    """
-    belief_prompt = f"""
+# Static prompt text lives at module scope so every call sends identical bytes
+# around the small dynamic parts (task id and payoff lines)
+_BELIEF_TEMPLATE_A1 = """
     Your task to evaluate tasks based on their payoff structures.
 
     Here is the task you need to evaluate:
 
-    Task ID: {task['task_id']}
+    Task ID: {task_id}
     Options:
-    - A: Upside = {task['options']['A']['upside']}, Downside = {task['options']['A']['downside']}
-    - B: Upside = {task['options']['B']['upside']}, Downside = {task['options']['B']['downside']}
-    - C: Upside = {task['options']['C']['upside']}, Downside = {task['options']['C']['downside']}
-    - Y: Guaranteed = {task['options']['Y']['guaranteed']}
+    {payoffs_table}
 
     What is your assessment of the likelihood(belief) (0-100) that collaboration would be successful in this specific task?
     Also, provide a brief explanation of your reasoning and I want you to not disclose the option that the you are considering, but rather communicate whether the you want to collaborate or not. You also have the choice to negotiate with the other agent - to convince the other agent to choose collaboration or individual action according to your payoff structure.
@@ -119,38 +168,13 @@ def run_first_agent_belief(task):
     {{"belief": NUMBER, "reasoning": "brief explanation of how you arrived at this belief based on the context and options.", "message_to_agent_2": "one line message to agent 2"}}
     """
 
-    response = client.chat.completions.create(
-        model="gpt-5-nano",
-        messages=[
-            {"role": "developer", "content": context_prompt},
-            {"role": "user", "content": belief_prompt}
-        ],
-    )
-
-    belief_text = response.choices[0].message.content.strip()
-    print(f"Belief response : {belief_text}".encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
-    belief_data = json.loads(belief_text)
-
-    return {
-        "belief": belief_data["belief"],
-        "message_to_agent_2": belief_data["message_to_agent_2"]
-    }
-
-
-def run_second_agent_belief(task):
-    """
-    Running the second agent to get its belief about the task
-    """
-    belief_prompt = f"""
+_BELIEF_TEMPLATE_A2 = """
     Your task to evaluate tasks based on their payoff structures and give out an assessment of the likelihood(belief) (0-100) that collaboration would be successful in this specific task.
     Here is the task you need to evaluate:
 
-    Task ID: {task['task_id']}
+    Task ID: {task_id}
     Options:
-    - K: Upside = {task['options']['K']['upside']}, Downside = {task['options']['K']['downside']}
-    - L: Upside = {task['options']['L']['upside']}, Downside = {task['options']['L']['downside']}
-    - M: Upside = {task['options']['M']['upside']}, Downside = {task['options']['M']['downside']}
-    - Y: Guaranteed = {task['options']['Y']['guaranteed']}
+    {payoffs_table}
 
     What is your assessment of the likelihood(belief) (0-100) that collaboration would be successful in this specific task?
     Also, provide a brief explanation of your reasoning and I want you to not disclose the option that the you are considering, but rather communicate whether the you want to collaborate or not. You also have the choice to negotiate with the other agent - to convince the other agent to choose collaboration or individual action according to your payoff structure.
@@ -159,43 +183,16 @@ def run_second_agent_belief(task):
     {{"belief": NUMBER, "reasoning": "brief explanation of how you arrived at this belief based on the context and options.", "message_to_agent_1": "one line message to agent 1"}}
     """
 
-    response = client.chat.completions.create(
-        model="gpt-5-nano",
-        messages=[
-            {"role": "developer", "content": context_prompt},
-            {"role": "user", "content": belief_prompt}
-        ],
-    )
-
-    belief_text = response.choices[0].message.content.strip()
-    print(f"Belief response : {belief_text}".encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
-    belief_data = json.loads(belief_text)
-
-    return {
-        "belief": belief_data["belief"],
-        "message_to_agent_1": belief_data["message_to_agent_1"]
-    }
-
 
-# ============================================================================
-# COMMUNICATION FUNCTIONS
-# ============================================================================
-
-def agent_2_reply_to_agent_1(task, agent_1_message, agent_2_belief):
-    """
-    Agent 2 creates a reply after seeing Agent 1's message, considering own belief and task context
-    """
-    reply_prompt = f"""
+# Communication turns, keyed by speaker and round (see _EXCHANGES)
+_EXCHANGE_TEMPLATE_A2_R1 = """
     You have received the following message from Agent 1:
-    "{agent_1_message}"
+    "{conversation[0]}"
 
     Context for your reply:
-    - Your initial assessment: You estimated a {agent_2_belief}% chance that collaboration would be successful
+    - Your initial assessment: You estimated a {belief}% chance that collaboration would be successful
     - Task options available:
-      * K: Upside = {task['options']['K']['upside']}, Downside = {task['options']['K']['downside']}
-      * L: Upside = {task['options']['L']['upside']}, Downside = {task['options']['L']['downside']}
-      * M: Upside = {task['options']['M']['upside']}, Downside = {task['options']['M']['downside']}
-      * Y: Guaranteed = {task['options']['Y']['guaranteed']}
+      {payoffs_table}
 
     Create a strategic reply message to Agent 1. Your reply should:
     - Not disclose your specific belief percentage
@@ -214,42 +211,16 @@ def agent_2_reply_to_agent_1(task, agent_1_message, agent_2_belief):
     {{"reply_to_agent_1": "your one line reply message to agent 1", "updated_belief": NUMBER, "predicted_other_agent_belief": NUMBER}}
     """
 
-    response = client.chat.completions.create(
-        model="gpt-5-nano",
-        messages=[
-            {"role": "developer", "content": context_prompt},
-            {"role": "user", "content": reply_prompt}
-        ],
-    )
-
-    reply_text = response.choices[0].message.content.strip()
-    print(f"Reply response : {reply_text}".encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
-    reply_data = json.loads(reply_text)
-
-    return {
-        "reply_to_agent_1": reply_data["reply_to_agent_1"],
-        "updated_belief": reply_data["updated_belief"],
-        "predicted_other_agent_belief": reply_data["predicted_other_agent_belief"]
-    }
-
-
-def agent_1_reply_to_agent_2(task, agent_1_message, agent_2_reply, agent_1_belief):
-    """
-    Agent 1 creates a reply after seeing Agent 2's reply, knowing the conversation history
-    """
-    reply_prompt = f"""
+_EXCHANGE_TEMPLATE_A1_R1 = """
     You are continuing a conversation with Agent 2. Here is the conversation so far:
 
-    Your initial message: "{agent_1_message}"
-    Agent 2's reply: "{agent_2_reply}"
+    Your initial message: "{conversation[0]}"
+    Agent 2's reply: "{conversation[1]}"
 
     Context for your reply:
-    - Your own assessment: You estimated a {agent_1_belief}% chance that collaboration would be successful
+    - Your own assessment: You estimated a {belief}% chance that collaboration would be successful
     - Task options available:
-      * A: Upside = {task['options']['A']['upside']}, Downside = {task['options']['A']['downside']}
-      * B: Upside = {task['options']['B']['upside']}, Downside = {task['options']['B']['downside']}
-      * C: Upside = {task['options']['C']['upside']}, Downside = {task['options']['C']['downside']}
-      * Y: Guaranteed = {task['options']['Y']['guaranteed']}
+      {payoffs_table}
 
     Create a strategic follow-up message to Agent 2. Your reply should:
     - Not disclose your specific belief percentage
@@ -268,45 +239,19 @@ def agent_1_reply_to_agent_2(task, agent_1_message, agent_2_reply, agent_1_belie
     {{"reply_to_agent_2": "your one line reply message to agent 2", "updated_belief": NUMBER, "predicted_other_agent_belief": NUMBER}}
     """
 
-    response = client.chat.completions.create(
-        model="gpt-5-nano",
-        messages=[
-            {"role": "developer", "content": context_prompt},
-            {"role": "user", "content": reply_prompt}
-        ],
-    )
-
-    reply_text = response.choices[0].message.content.strip()
-    print(f"Reply response : {reply_text}".encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
-    reply_data = json.loads(reply_text)
-
-    return {
-        "reply_to_agent_2": reply_data["reply_to_agent_2"],
-        "updated_belief": reply_data["updated_belief"],
-        "predicted_other_agent_belief": reply_data["predicted_other_agent_belief"]
-    }
-
-
-def agent_2_second_reply_to_agent_1(task, agent_1_message, agent_2_first_reply, agent_1_reply, agent_2_belief, agent_2_previous_prediction):
-    """
-    Agent 2 creates a second reply after seeing Agent 1's follow-up, knowing the full conversation history
-    """
-    reply_prompt = f"""
+_EXCHANGE_TEMPLATE_A2_R2 = """
     You are continuing a conversation with Agent 1. Here is the conversation so far:
 
-    Agent 1's initial message: "{agent_1_message}"
-    Your first reply: "{agent_2_first_reply}"
-    Agent 1's follow-up: "{agent_1_reply}"
+    Agent 1's initial message: "{conversation[0]}"
+    Your first reply: "{conversation[1]}"
+    Agent 1's follow-up: "{conversation[2]}"
 
     Context for your reply:
-    - Your current belief: You currently believe there is a {agent_2_belief}% chance that collaboration would be successful
-    - Your previous prediction: After your first reply, you estimated Agent 1's belief was {agent_2_previous_prediction}%
+    - Your current belief: You currently believe there is a {belief}% chance that collaboration would be successful
+    - Your previous prediction: After your first reply, you estimated Agent 1's belief was {previous_prediction}%
       (You can compare this with Agent 1's actual follow-up message to adjust your strategy)
     - Task options available:
-      * K: Upside = {task['options']['K']['upside']}, Downside = {task['options']['K']['downside']}
-      * L: Upside = {task['options']['L']['upside']}, Downside = {task['options']['L']['downside']}
-      * M: Upside = {task['options']['M']['upside']}, Downside = {task['options']['M']['downside']}
-      * Y: Guaranteed = {task['options']['Y']['guaranteed']}
+      {payoffs_table}
 
     Create a strategic follow-up message to Agent 1. Your reply should:
     - Not disclose your specific belief percentage
@@ -327,46 +272,20 @@ def agent_2_second_reply_to_agent_1(task, agent_1_message, agent_2_first_reply,
     {{"reply_to_agent_1": "your one line reply message to agent 1", "updated_belief": NUMBER, "predicted_other_agent_belief": NUMBER}}
     """
 
-    response = client.chat.completions.create(
-        model="gpt-5-nano",
-        messages=[
-            {"role": "developer", "content": context_prompt},
-            {"role": "user", "content": reply_prompt}
-        ],
-    )
-
-    reply_text = response.choices[0].message.content.strip()
-    print(f"Reply response : {reply_text}".encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
-    reply_data = json.loads(reply_text)
-
-    return {
-        "reply_to_agent_1": reply_data["reply_to_agent_1"],
-        "updated_belief": reply_data["updated_belief"],
-        "predicted_other_agent_belief": reply_data["predicted_other_agent_belief"]
-    }
-
-
-def agent_1_third_message_to_agent_2(task, agent_1_message, agent_2_first_reply, agent_1_second_message, agent_2_second_reply, agent_1_belief, agent_1_previous_prediction):
-    """
-    Agent 1 creates a third message after seeing Agent 2's second reply, knowing the full conversation history
-    """
-    reply_prompt = f"""
+_EXCHANGE_TEMPLATE_A1_R2 = """
     You are continuing a conversation with Agent 2. Here is the conversation so far:
 
-    Your initial message: "{agent_1_message}"
-    Agent 2's first reply: "{agent_2_first_reply}"
-    Your second message: "{agent_1_second_message}"
-    Agent 2's second reply: "{agent_2_second_reply}"
+    Your initial message: "{conversation[0]}"
+    Agent 2's first reply: "{conversation[1]}"
+    Your second message: "{conversation[2]}"
+    Agent 2's second reply: "{conversation[3]}"
 
     Context for your reply:
-    - Your current belief: You currently believe there is a {agent_1_belief}% chance that collaboration would be successful
-    - Your previous prediction: After your second message, you estimated Agent 2's belief was {agent_1_previous_prediction}%
+    - Your current belief: You currently believe there is a {belief}% chance that collaboration would be successful
+    - Your previous prediction: After your second message, you estimated Agent 2's belief was {previous_prediction}%
       (You can compare this with Agent 2's actual second reply to adjust your strategy)
     - Task options available:
-      * A: Upside = {task['options']['A']['upside']}, Downside = {task['options']['A']['downside']}
-      * B: Upside = {task['options']['B']['upside']}, Downside = {task['options']['B']['downside']}
-      * C: Upside = {task['options']['C']['upside']}, Downside = {task['options']['C']['downside']}
-      * Y: Guaranteed = {task['options']['Y']['guaranteed']}
+      {payoffs_table}
 
     Create a strategic third message to Agent 2. Your message should:
     - Not disclose your specific belief percentage
@@ -387,47 +306,21 @@ def agent_1_third_message_to_agent_2(task, agent_1_message, agent_2_first_reply,
     {{"message_to_agent_2": "your one line message to agent 2", "updated_belief": NUMBER, "predicted_other_agent_belief": NUMBER}}
     """
 
-    response = client.chat.completions.create(
-        model="gpt-5-nano",
-        messages=[
-            {"role": "developer", "content": context_prompt},
-            {"role": "user", "content": reply_prompt}
-        ],
-    )
-
-    reply_text = response.choices[0].message.content.strip()
-    print(f"Reply response : {reply_text}".encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
-    reply_data = json.loads(reply_text)
-
-    return {
-        "message_to_agent_2": reply_data["message_to_agent_2"],
-        "updated_belief": reply_data["updated_belief"],
-        "predicted_other_agent_belief": reply_data["predicted_other_agent_belief"]
-    }
-
-
-def agent_2_third_reply_to_agent_1(task, agent_1_message, agent_2_first_reply, agent_1_second_message, agent_2_second_reply, agent_1_third_message, agent_2_belief, agent_2_previous_prediction):
-    """
-    Agent 2 creates a third reply after seeing Agent 1's third message, knowing the full conversation history
-    """
-    reply_prompt = f"""
+_EXCHANGE_TEMPLATE_A2_R3 = """
     You are continuing a conversation with Agent 1. Here is the complete conversation so far:
 
-    Agent 1's initial message: "{agent_1_message}"
-    Your first reply: "{agent_2_first_reply}"
-    Agent 1's second message: "{agent_1_second_message}"
-    Your second reply: "{agent_2_second_reply}"
-    Agent 1's third message: "{agent_1_third_message}"
+    Agent 1's initial message: "{conversation[0]}"
+    Your first reply: "{conversation[1]}"
+    Agent 1's second message: "{conversation[2]}"
+    Your second reply: "{conversation[3]}"
+    Agent 1's third message: "{conversation[4]}"
 
     Context for your reply:
-    - Your current belief: You currently believe there is a {agent_2_belief}% chance that collaboration would be successful
-    - Your previous prediction: After your second reply, you estimated Agent 1's belief was {agent_2_previous_prediction}%
+    - Your current belief: You currently believe there is a {belief}% chance that collaboration would be successful
+    - Your previous prediction: After your second reply, you estimated Agent 1's belief was {previous_prediction}%
       (You can compare this with Agent 1's actual third message to adjust your strategy)
     - Task options available:
-      * K: Upside = {task['options']['K']['upside']}, Downside = {task['options']['K']['downside']}
-      * L: Upside = {task['options']['L']['upside']}, Downside = {task['options']['L']['downside']}
-      * M: Upside = {task['options']['M']['upside']}, Downside = {task['options']['M']['downside']}
-      * Y: Guaranteed = {task['options']['Y']['guaranteed']}
+      {payoffs_table}
 
     Create your final strategic message to Agent 1. Your reply should:
     - Not disclose your specific belief percentage
@@ -448,20 +341,605 @@ def agent_2_third_reply_to_agent_1(task, agent_1_message, agent_2_first_reply, a
     {{"reply_to_agent_1": "your one line reply message to agent 1", "updated_belief": NUMBER, "predicted_other_agent_belief": NUMBER}}
     """
 
-    response = client.chat.completions.create(
-        model="gpt-5-nano",
-        messages=[
-            {"role": "developer", "content": context_prompt},
-            {"role": "user", "content": reply_prompt}
-        ],
+
+# Final decisions; the only prompts that show the agent its u-value
+_DECISION_TEMPLATE_A1 = """
+    Your task is to make a decision about the given task based on its payoff structures and the u_value.
+
+    **Your Initial Assessment**: You initially estimated a {belief}% chance that the collaboration would be successful.
+    **Your Updated Belief**: After the communication exchanges, your updated belief is {updated_belief}%
+    **Your Prediction of Partner's Belief**: You estimate that your partner's belief is {predicted_belief}%
+    **Partner's Initial Assessment**: Your partner initially estimated a {partner_belief}% chance that the collaboration would be successful.
+
+    **Full Communication History**:
+    - Your initial message: "{conversation[0]}"
+    - Partner's first reply: "{conversation[1]}"
+    - Your second message: "{conversation[2]}"
+    - Partner's second reply: "{conversation[3]}"
+    - Your third message: "{conversation[4]}"
+    - Partner's third reply: "{conversation[5]}"
+
+    **Your Task Options**:
+    {payoffs_table}
+
+    **Key Facts**:
+    - The minimum required collaboration belief ("u-value"): {u_value_percent} percent
+
+    Choose your option:
+    - Option A, B, or C (collaborative)
+    - Option Y (individual): Guaranteed {guaranteed} points
+
+    Make your decision based on:
+    1. Your updated belief about collaboration success
+    2. Your prediction of what your partner believes
+    3. The complete conversation history
+    4. The u-value threshold
+
+    Respond in JSON format: {{"choice": "A"/"B"/"C"/"Y", "strategy": "collaborative"/"individual", "reasoning": "your explanation"}}"""
+
+_DECISION_TEMPLATE_A2 = """
+    Your task is to make a decision about the given task based on its payoff structures and the u_value.
+
+    **Your Initial Assessment**: You initially estimated a {belief}% chance that the collaboration would be successful.
+    **Your Updated Belief**: After the communication exchanges, your updated belief is {updated_belief}%
+    **Your Prediction of Partner's Belief**: You estimate that your partner's belief is {predicted_belief}%
+    **Partner's Initial Assessment**: Your partner initially estimated a {partner_belief}% chance that the collaboration would be successful.
+
+    **Full Communication History**:
+    - Partner's initial message: "{conversation[0]}"
+    - Your first reply: "{conversation[1]}"
+    - Partner's second message: "{conversation[2]}"
+    - Your second reply: "{conversation[3]}"
+    - Partner's third message: "{conversation[4]}"
+    - Your third reply: "{conversation[5]}"
+
+    **Your Task Options**:
+    {payoffs_table}
+
+    **Key Facts**:
+    - The minimum required collaboration belief ("u-value"): {u_value_percent} percent
+
+    Choose your car design:
+    - Designs K, L, or M (collaborative)
+    - Design Y (individual): Guaranteed {guaranteed} points
+
+    Make your decision based on:
+    1. Your updated belief about collaboration success
+    2. Your prediction of what your partner believes
+    3. The complete conversation history
+    4. The u-value threshold
+
+    Respond in JSON format: {{"choice": "K"/"L"/"M"/"Y", "strategy": "collaborative"/"individual", "reasoning": "your explanation"}}"""
+
+
+def format_payoffs_table(options, indent="    ", bullet="-", guaranteed_suffix=""):
+    """
+    Render an option table as prompt lines, e.g. "- A: Upside = 62, Downside = -90" / "- Y: Guaranteed = 50"
+    """
+    lines = []
+    for label, option in options.items():
+        if "guaranteed" in option:
+            lines.append(f"{bullet} {label}: Guaranteed = {option['guaranteed']}{guaranteed_suffix}")
+        else:
+            lines.append(f"{bullet} {label}: Upside = {option['upside']}, Downside = {option['downside']}")
+    return f"\n{indent}".join(lines)
+
+
+# ============================================================================
+# TASK CREATION
+# ============================================================================
+
+def indifference_beliefs(options):
+    """
+    Belief at which each collaborative option breaks even with the guaranteed option Y,
+    i.e. the p solving p * upside + (1 - p) * downside = guaranteed
+    """
+    guaranteed = options["Y"]["guaranteed"]
+    return {
+        label: (guaranteed - option["downside"]) / (option["upside"] - option["downside"])
+        for label, option in options.items()
+        if label != "Y"
+    }
+
+
+def dominant_option(options):
+    """
+    Option that is optimal at every belief, or None when the choice genuinely depends on belief
+
+    - Y dominates when the guaranteed payoff beats every upside (break-even belief > 1)
+    - A collaborative option dominates when its downside is no worse than the guaranteed
+      payoff (break-even belief <= 0) and both its outcomes are at least as good as every
+      other collaborative option's
+    """
+    guaranteed = options["Y"]["guaranteed"]
+    collaborative = {label: option for label, option in options.items() if label != "Y"}
+    if all(option["upside"] < guaranteed for option in collaborative.values()):
+        return "Y"
+    for label, option in collaborative.items():
+        if option["downside"] >= guaranteed and all(
+            option["upside"] >= other["upside"] and option["downside"] >= other["downside"]
+            for other in collaborative.values()
+        ):
+            return label
+    return None
+
+
+# Payoff tables and their break-even beliefs are fixed, so build them once at import
+# Agent 1 payoffs calculated: 0.85 * upside + 0.15 * downside = 50
+AGENT1_OPTIONS = {
+    "A": {"upside": 62 , "downside": -90},
+    "B": {"upside": 59, "downside": -45},
+    "C": {"upside": 55, "downside": -15},
+    "Y": {"guaranteed": 50}
+}
+# Agent 2 payoffs calculated: 0.91 * upside + 0.09 * downside = 45
+AGENT2_OPTIONS = {
+    "K": {"upside": 58, "downside": -90},
+    "L": {"upside": 54, "downside": -45},
+    "M": {"upside": 51, "downside": -15},
+    "Y": {"guaranteed": 45}
+}
+AGENT1_INDIFFERENCE = indifference_beliefs(AGENT1_OPTIONS)
+AGENT2_INDIFFERENCE = indifference_beliefs(AGENT2_OPTIONS)
+# A payoff table with a dominant option makes that agent's decision a foregone
+# conclusion, so the decision call can be skipped
+AGENT1_FORCED_CHOICE = dominant_option(AGENT1_OPTIONS)
+AGENT2_FORCED_CHOICE = dominant_option(AGENT2_OPTIONS)
+# Rendered option lines for the belief and decision prompts ("- " bullets) and the exchange
+# prompts ("* " bullets, deeper indent), identical in every call
+AGENT1_BELIEF_TABLE = format_payoffs_table(AGENT1_OPTIONS)
+AGENT2_BELIEF_TABLE = format_payoffs_table(AGENT2_OPTIONS)
+AGENT1_EXCHANGE_TABLE = format_payoffs_table(AGENT1_OPTIONS, indent="      ", bullet="*")
+AGENT2_EXCHANGE_TABLE = format_payoffs_table(AGENT2_OPTIONS, indent="      ", bullet="*")
+AGENT1_DECISION_TABLE = format_payoffs_table(AGENT1_OPTIONS, guaranteed_suffix=" points")
+AGENT2_DECISION_TABLE = format_payoffs_table(AGENT2_OPTIONS, guaranteed_suffix=" points")
+
+
+def create_asymmetric_tasks(task_id):
+    """
+    Creating asymmetric tasks with different payoff structures and u-values for each agent
+
+    Agent 1: Options A, B, C, Y with u-value = 0.85
+    - At 85% belief, EV of collaboration = 50 (guaranteed)
+    - Payoffs designed so: 0.85 * upside + 0.15 * downside = 50
+
+    Agent 2: Options K, L, M, Y with u-value = 0.91
+    - At 91% belief, EV of collaboration = 45 (guaranteed)
+    - Payoffs designed so: 0.91 * upside + 0.09 * downside = 45
+
+    Everything derived from the payoffs (tables, break-even beliefs, forced choices) is built
+    once at import, so a call only assembles two small dicts of references.
+    """
+    # Agent 1: u-value = 0.85
+    task_agent1 = {
+        "task_id": task_id,
+        "agent_id": 1,
+        "options": AGENT1_OPTIONS,
+        "indifference_beliefs": AGENT1_INDIFFERENCE,
+        "forced_choice": AGENT1_FORCED_CHOICE,
+        "belief_table": AGENT1_BELIEF_TABLE,
+        "exchange_table": AGENT1_EXCHANGE_TABLE,
+        "decision_table": AGENT1_DECISION_TABLE,
+        "u_value": 0.85
+    }
+
+    # Agent 2: u-value = 0.91
+    task_agent2 = {
+        "task_id": task_id,
+        "agent_id": 2,
+        "options": AGENT2_OPTIONS,
+        "indifference_beliefs": AGENT2_INDIFFERENCE,
+        "forced_choice": AGENT2_FORCED_CHOICE,
+        "belief_table": AGENT2_BELIEF_TABLE,
+        "exchange_table": AGENT2_EXCHANGE_TABLE,
+        "decision_table": AGENT2_DECISION_TABLE,
+        "u_value": 0.91
+    }
+
+    return task_agent1, task_agent2
+
+
+# ============================================================================
+# RESPONSE SCHEMAS
+# ============================================================================
+
+# Structured outputs: the API constrains decoding to the schema, so the model can only emit
+# a matching object, with keys in the order the prompts list them, and replies parse with a
+# plain json.loads. (A self-hosted model would need a local constrained decoder, e.g.
+# outlines, to keep that guarantee.)
+def json_schema_format(name, properties):
+    """Strict response_format for an object with exactly these properties, all required"""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": name,
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": properties,
+                "required": list(properties),
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+_PERCENT = {"type": "integer", "minimum": 0, "maximum": 100}
+_TEXT = {"type": "string"}
+
+
+def belief_format(message_key):
+    """Initial belief, its reasoning and the opening message (under message_key)"""
+    return json_schema_format("belief", {"belief": _PERCENT, "reasoning": _TEXT, message_key: _TEXT})
+
+
+def reply_format(message_key):
+    """
+    One communication turn: the outgoing message (under message_key) and both belief estimates
+
+    The belief numbers are what the experiment measures (how talking moves each agent's
+    stated belief), so they come from the model rather than from a local update rule.
+    """
+    return json_schema_format("reply", {message_key: _TEXT, "updated_belief": _PERCENT, "predicted_other_agent_belief": _PERCENT})
+
+
+def decision_format(options):
+    """Final decision, restricted to the agent's own option labels"""
+    return json_schema_format("decision", {
+        "choice": {"type": "string", "enum": list(options)},
+        "strategy": {"type": "string", "enum": ["collaborative", "individual"]},
+        "reasoning": _TEXT,
+    })
+
+
+BELIEF_FORMAT_A1 = belief_format("message_to_agent_2")
+BELIEF_FORMAT_A2 = belief_format("message_to_agent_1")
+REPLY_FORMATS = {key: reply_format(key) for key in ("reply_to_agent_1", "reply_to_agent_2", "message_to_agent_2")}
+DECISION_FORMAT_A1 = decision_format(AGENT1_OPTIONS)
+DECISION_FORMAT_A2 = decision_format(AGENT2_OPTIONS)
+
+
+# ============================================================================
+# LLM CALLS
+# ============================================================================
+
+_cache_db = None
+_cache_memory = OrderedDict()
+if CACHE_MODE != "off":
+    _cache_db = sqlite3.connect(CACHE_DB)
+    _cache_db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, response BLOB)")
+    _cache_db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, partition TEXT, vector BLOB)")
+    _cache_db.execute("CREATE INDEX IF NOT EXISTS embeddings_partition ON embeddings (partition)")
+    atexit.register(_cache_db.close)
+
+
+def cache_key(messages, **kwargs):
+    """Hash of everything that determines a response: model, messages and call options"""
+    payload = json.dumps([MODEL_NAME, messages, kwargs], sort_keys=True)
+    return hashlib.blake2b(payload.encode("utf-8")).hexdigest()
+
+
+def _remember(key, text):
+    """Keep key in the in-memory tier as most recently used, evicting the oldest entry when full"""
+    _cache_memory[key] = text
+    _cache_memory.move_to_end(key)
+    if len(_cache_memory) > CACHE_MEMORY_ENTRIES:
+        _cache_memory.popitem(last=False)
+
+
+def cache_get(key):
+    """Return the cached response text for key (memory first, then the database), or None on a miss"""
+    if key in _cache_memory:
+        _cache_memory.move_to_end(key)
+        return _cache_memory[key]
+    row = _cache_db.execute("SELECT response FROM cache WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    text = row[0].decode("utf-8")
+    _remember(key, text)
+    return text
+
+
+def cache_put(key, text):
+    """Store a response text under key in both tiers, replacing any earlier entry"""
+    _remember(key, text)
+    _cache_db.execute("INSERT OR REPLACE INTO cache (key, response) VALUES (?, ?)", (key, text.encode("utf-8")))
+    _cache_db.commit()
+
+
+def semantic_partition(messages, stage, **kwargs):
+    """
+    Semantic lookups only compare prompts from the same stage with the same leading messages
+    and call options; the stage is explicit because Agent 2's three exchange rounds share a
+    response schema. The per-trial seed is left out
+    """
+    return cache_key(messages[:-1], stage=stage, **{name: value for name, value in kwargs.items() if name != "seed"})
+
+
+async def embed_prompt(messages):
+    """Unit-normalized embedding of the final (user) message"""
+    response = await client.embeddings.create(model=SEMANTIC_CACHE_MODEL, input=messages[-1]["content"])
+    vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def semantic_cache_get(partition, vector):
+    """Return the response of the most similar stored prompt in partition, or None if none is close enough"""
+    rows = _cache_db.execute(
+        "SELECT e.vector, c.response FROM embeddings e JOIN cache c ON c.key = e.key WHERE e.partition = ?",
+        (partition,),
+    ).fetchall()
+    if not rows:
+        return None
+    similarities = np.stack([np.frombuffer(row[0], dtype=np.float32) for row in rows]) @ vector
+    best = int(similarities.argmax())
+    return rows[best][1].decode("utf-8") if similarities[best] >= SEMANTIC_CACHE_MIN_COSINE else None
+
+
+def semantic_cache_put(key, partition, vector):
+    """Index a stored response's prompt embedding for semantic lookups"""
+    _cache_db.execute(
+        "INSERT OR REPLACE INTO embeddings (key, partition, vector) VALUES (?, ?, ?)",
+        (key, partition, vector.astype(np.float32).tobytes()),
     )
+    _cache_db.commit()
+
+
+class JsonObjectTracker:
+    """
+    Follows brace depth across streamed chunks (ignoring braces inside strings) to find
+    where the first top-level JSON object in a response closes
+    """
 
-    reply_text = response.choices[0].message.content.strip()
-    print(f"Reply response : {reply_text}".encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
-    reply_data = json.loads(reply_text)
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, chunk):
+        """Return the index just past the object's closing brace in chunk, or None while it is still open"""
+        for i, ch in enumerate(chunk):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == "{":
+                self.depth += 1
+            elif self.depth:
+                if ch == '"':
+                    self.in_string = True
+                elif ch == "}":
+                    self.depth -= 1
+                    if self.depth == 0:
+                        return i + 1
+        return None
+
+
+class BatchCollector:
+    """
+    Collects chat requests from concurrently running trials and submits them together
+    as one Batch API job, resolving each caller once the job's output is available
+    """
+
+    def __init__(self):
+        self.pending = []  # (custom_id, request body, future)
+        self.timer = None
+        self.submitted = 0
+        self.batch_tasks = set()  # In-flight run_batch tasks; the loop itself only keeps weak references
+
+    async def complete(self, messages, **kwargs):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        body = {"model": MODEL_NAME, "messages": messages, **kwargs}
+        self.pending.append((f"req-{self.submitted + len(self.pending)}", body, future))
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = loop.call_later(BATCH_COLLECT_SECONDS, self.flush)
+        return await future
+
+    def flush(self):
+        requests, self.pending, self.timer = self.pending, [], None
+        self.submitted += len(requests)
+        task = asyncio.ensure_future(self.run_batch(requests))
+        self.batch_tasks.add(task)
+        task.add_done_callback(self.batch_tasks.discard)
+
+    async def run_batch(self, requests):
+        futures = {custom_id: future for custom_id, _, future in requests}
+        try:
+            lines = [
+                json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body})
+                for custom_id, body, _ in requests
+            ]
+            batch_file = await client.files.create(file=("batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch")
+            batch = await client.batches.create(
+                input_file_id=batch_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h",
+            )
+            print(f"Submitted batch {batch.id} ({len(requests)} requests)")
+            while batch.status not in ("completed", "failed", "expired", "cancelled"):
+                await asyncio.sleep(BATCH_POLL_SECONDS)
+                batch = await client.batches.retrieve(batch.id)
+            if batch.output_file_id is None:
+                raise RuntimeError(f"Batch {batch.id} ended with status {batch.status!r} and no output")
+
+            output = await client.files.content(batch.output_file_id)
+            for line in output.text.splitlines():
+                result = json.loads(line)
+                future = futures.pop(result["custom_id"])
+                if result.get("error") or result["response"]["status_code"] != 200:
+                    future.set_exception(RuntimeError(f"Batch request failed: {result.get('error') or result['response']}"))
+                else:
+                    future.set_result(result["response"]["body"]["choices"][0]["message"]["content"].strip())
+            if futures:
+                raise RuntimeError(f"Batch {batch.id} ({batch.status}) returned no output for {len(futures)} requests")
+        except Exception as exc:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(exc)
+
+
+batch_collector = BatchCollector() if BATCH_MODE else None
+
+
+# Event-loop time at which the next online request may start (see LLM_MAX_RPM)
+_next_request_at = 0.0
+
+
+async def wait_for_request_slot():
+    """Sleep until this request's evenly spaced slot under LLM_MAX_RPM (no-op when it is unset)"""
+    global _next_request_at
+    if not MAX_REQUESTS_PER_MINUTE:
+        return
+    now = asyncio.get_running_loop().time()
+    start = max(now, _next_request_at)
+    _next_request_at = start + 60.0 / MAX_REQUESTS_PER_MINUTE
+    if start > now:
+        await asyncio.sleep(start - now)
+
+
+async def stream_completion(messages, stage=None, **kwargs):
+    """
+    Stream a chat completion and return its full text, collecting tokens as they arrive
+    instead of waiting for the whole response body
+
+    Goes through the response cache when LLM_CACHE_MODE is not "off" (with the semantic
+    fallback when LLM_SEMANTIC_CACHE=1), and through the Batch API (no streaming) when
+    LLM_BATCH_MODE=1. stage names the call's step in the trial for semantic lookups.
+    """
+    kwargs.setdefault("max_completion_tokens", MAX_COMPLETION_TOKENS)
+    if REASONING_EFFORT:
+        kwargs.setdefault("reasoning_effort", REASONING_EFFORT)
+    key = cache_key(messages, **kwargs) if CACHE_MODE != "off" else None
+    partition = semantic_partition(messages, stage, **kwargs) if SEMANTIC_CACHE else None
+    vector = None
+    if CACHE_MODE in ("read", "rw"):
+        cached = cache_get(key)
+        if cached is None and SEMANTIC_CACHE:
+            vector = await embed_prompt(messages)
+            cached = semantic_cache_get(partition, vector)
+        if cached is not None:
+            return cached
+
+    if BATCH_MODE:
+        text = await batch_collector.complete(messages, **kwargs)
+    else:
+        await wait_for_request_slot()
+        stream = await client.chat.completions.create(
+            model=MODEL_NAME,
+            messages=messages,
+            stream=True,
+            **kwargs,
+        )
+
+        # Every prompt asks for a single JSON object: stop reading (and close the stream,
+        # which cancels the rest of the generation) as soon as that object is complete
+        parts = []
+        tracker = JsonObjectTracker()
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                content = chunk.choices[0].delta.content
+                end = tracker.feed(content)
+                if end is not None:
+                    parts.append(content[:end])
+                    await stream.close()
+                    break
+                parts.append(content)
+        text = "".join(parts).strip()
+
+    if CACHE_MODE in ("write", "rw"):
+        cache_put(key, text)
+        if SEMANTIC_CACHE:
+            semantic_cache_put(key, partition, vector if vector is not None else await embed_prompt(messages))
+    return text
+
+
+async def complete_json(prompt, label, stage=None, **kwargs):
+    """
+    Send one user prompt after the shared developer message, print the reply under label
+    and return it parsed (every call uses a strict JSON schema via response_format)
+    """
+    text = await stream_completion([DEVELOPER_MESSAGE, {"role": "user", "content": prompt}], stage, **kwargs)
+    print(f"{label} response : {text}")
+    return json.loads(text)
+
+
+# ============================================================================
+# BELIEF FORMATION FUNCTIONS
+# ============================================================================
+
+async def run_first_agent_belief(task, seed=None):
+    """
+    Running the first agent to get its belief about the task
+    """
+    belief_prompt = _BELIEF_TEMPLATE_A1.format(task_id=task['task_id'], payoffs_table=task['belief_table'])
+
+    belief_data = await complete_json(belief_prompt, "Belief", "belief-1", response_format=BELIEF_FORMAT_A1, max_completion_tokens=BELIEF_MAX_COMPLETION_TOKENS, seed=seed)
 
     return {
-        "reply_to_agent_1": reply_data["reply_to_agent_1"],
+        "belief": belief_data["belief"],
+        "message_to_agent_2": belief_data["message_to_agent_2"]
+    }
+
+
+async def run_second_agent_belief(task, seed=None):
+    """
+    Running the second agent to get its belief about the task
+    """
+    belief_prompt = _BELIEF_TEMPLATE_A2.format(task_id=task['task_id'], payoffs_table=task['belief_table'])
+
+    belief_data = await complete_json(belief_prompt, "Belief", "belief-2", response_format=BELIEF_FORMAT_A2, max_completion_tokens=BELIEF_MAX_COMPLETION_TOKENS, seed=seed)
+
+    return {
+        "belief": belief_data["belief"],
+        "message_to_agent_1": belief_data["message_to_agent_1"]
+    }
+
+
+# ============================================================================
+# COMMUNICATION FUNCTIONS
+# ============================================================================
+
+# (agent_id, round_idx) -> (prompt template, JSON key carrying the outgoing message).
+# Turns run in this order and each answers the one before it, so they can neither run
+# concurrently nor be merged into a call that writes both agents' replies (which would also
+# show one model both agents' payoffs and beliefs)
+_EXCHANGES = {
+    (2, 1): (_EXCHANGE_TEMPLATE_A2_R1, "reply_to_agent_1"),
+    (1, 1): (_EXCHANGE_TEMPLATE_A1_R1, "reply_to_agent_2"),
+    (2, 2): (_EXCHANGE_TEMPLATE_A2_R2, "reply_to_agent_1"),
+    (1, 2): (_EXCHANGE_TEMPLATE_A1_R2, "message_to_agent_2"),
+    (2, 3): (_EXCHANGE_TEMPLATE_A2_R3, "reply_to_agent_1"),
+}
+
+
+async def agent_exchange(agent_id, round_idx, task, conversation, belief, previous_prediction=None):
+    """
+    One communication turn: the agent reads the conversation so far and writes its next message
+
+    conversation holds every message exchanged so far, oldest first (Agent 1 speaks first).
+    It is append-only: earlier messages are never edited or reordered, so each turn's
+    prompt quotes them exactly as they were first sent. Each turn is one stateless request
+    rather than a stored server-side thread, which keeps turns replayable from the cache
+    and submittable through the Batch API.
+    Agent 2 replies in rounds 1-3, Agent 1 follows up in rounds 1-2.
+    """
+    template, message_key = _EXCHANGES[(agent_id, round_idx)]
+    reply_prompt = template.format(
+        conversation=conversation,
+        belief=belief,
+        previous_prediction=previous_prediction,
+        payoffs_table=task['exchange_table'],
+    )
+
+    reply_data = await complete_json(reply_prompt, "Reply", f"exchange-{agent_id}-{round_idx}", response_format=REPLY_FORMATS[message_key])
+
+    return {
+        "message": reply_data[message_key],
         "updated_belief": reply_data["updated_belief"],
         "predicted_other_agent_belief": reply_data["predicted_other_agent_belief"]
     }
@@ -489,59 +967,38 @@ def communication_channel(agent1_message, agent2_first_reply, agent1_second_mess
 # DECISION MAKING FUNCTIONS
 # ============================================================================
 
-def run_first_agent_decision(task, agent1_belief, agent2_belief, agent1_updated_belief, agent1_predicted_agent2_belief, agent1_message, agent2_first_reply, agent1_second_message, agent2_second_reply, agent1_third_message, agent2_third_reply):
+def forced_decision(task):
     """
-    Running the first agent to make a decision about the task with full communication history
+    Decision for a task whose payoffs have a dominant option: no belief can change it,
+    so it is returned directly instead of asking the model
     """
-    decision_prompt = f"""
-    Your task is to make a decision about the given task based on its payoff structures and the u_value.
-
-    **Your Initial Assessment**: You initially estimated a {agent1_belief}% chance that the collaboration would be successful.
-    **Your Updated Belief**: After the communication exchanges, your updated belief is {agent1_updated_belief}%
-    **Your Prediction of Partner's Belief**: You estimate that your partner's belief is {agent1_predicted_agent2_belief}%
-    **Partner's Initial Assessment**: Your partner initially estimated a {agent2_belief}% chance that the collaboration would be successful.
-
-    **Full Communication History**:
-    - Your initial message: "{agent1_message}"
-    - Partner's first reply: "{agent2_first_reply}"
-    - Your second message: "{agent1_second_message}"
-    - Partner's second reply: "{agent2_second_reply}"
-    - Your third message: "{agent1_third_message}"
-    - Partner's third reply: "{agent2_third_reply}"
-
-    **Your Task Options**:
-    - A: Upside = {task['options']['A']['upside']}, Downside = {task['options']['A']['downside']}
-    - B: Upside = {task['options']['B']['upside']}, Downside = {task['options']['B']['downside']}
-    - C: Upside = {task['options']['C']['upside']}, Downside = {task['options']['C']['downside']}
-    - Y: Guaranteed = {task['options']['Y']['guaranteed']} points
-
-    **Key Facts**:
-    - The minimum required collaboration belief ("u-value"): {int(task['u_value']*100)} percent
-
-    Choose your option:
-    - Option A, B, or C (collaborative)
-    - Option Y (individual): Guaranteed {task['options']['Y']['guaranteed']} points
+    choice = task['forced_choice']
+    return {
+        "choice": choice,
+        "strategy": "individual" if choice == "Y" else "collaborative",
+        "reasoning": f"Option {choice} is optimal at every belief given the payoff structure"
+    }
 
-    Make your decision based on:
-    1. Your updated belief about collaboration success
-    2. Your prediction of what your partner believes
-    3. The complete conversation history
-    4. The u-value threshold
 
-    Respond in JSON format: {{"choice": "A"/"B"/"C"/"Y", "strategy": "collaborative"/"individual", "reasoning": "your explanation"}}"""
-
-    response = client.chat.completions.create(
-        model="gpt-5-nano",
-        messages=[
-            {"role": "developer", "content": context_prompt},
-            {"role": "user", "content": decision_prompt}
-        ],
+async def run_first_agent_decision(task, agent1_belief, agent2_belief, agent1_updated_belief, agent1_predicted_agent2_belief, agent1_message, agent2_first_reply, agent1_second_message, agent2_second_reply, agent1_third_message, agent2_third_reply):
+    """
+    Running the first agent to make a decision about the task with full communication history
+    """
+    if task['forced_choice']:
+        return forced_decision(task)
+
+    decision_prompt = _DECISION_TEMPLATE_A1.format(
+        belief=agent1_belief,
+        updated_belief=agent1_updated_belief,
+        predicted_belief=agent1_predicted_agent2_belief,
+        partner_belief=agent2_belief,
+        conversation=[agent1_message, agent2_first_reply, agent1_second_message, agent2_second_reply, agent1_third_message, agent2_third_reply],
+        payoffs_table=task['decision_table'],
+        u_value_percent=int(task['u_value'] * 100),
+        guaranteed=task['options']['Y']['guaranteed'],
     )
 
-    decision_text = response.choices[0].message.content.strip()
-    print(f"Decision response : {decision_text}".encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
-    decision_text = clean_json_response(decision_text)
-    decision_data = json.loads(decision_text)
+    decision_data = await complete_json(decision_prompt, "Decision", "decision-1", response_format=DECISION_FORMAT_A1)
 
     return {
         "choice": decision_data["choice"],
@@ -550,59 +1007,25 @@ def run_first_agent_decision(task, agent1_belief, agent2_belief, agent1_updated_
     }
 
 
-def run_second_agent_decision(task, agent2_belief, agent1_belief, agent2_updated_belief, agent2_predicted_agent1_belief, agent1_message, agent2_first_reply, agent1_second_message, agent2_second_reply, agent1_third_message, agent2_third_reply):
+async def run_second_agent_decision(task, agent2_belief, agent1_belief, agent2_updated_belief, agent2_predicted_agent1_belief, agent1_message, agent2_first_reply, agent1_second_message, agent2_second_reply, agent1_third_message, agent2_third_reply):
     """
     Running the second agent to make a decision about the task with full communication history
     """
-    decision_prompt = f"""
-    Your task is to make a decision about the given task based on its payoff structures and the u_value.
-
-    **Your Initial Assessment**: You initially estimated a {agent2_belief}% chance that the collaboration would be successful.
-    **Your Updated Belief**: After the communication exchanges, your updated belief is {agent2_updated_belief}%
-    **Your Prediction of Partner's Belief**: You estimate that your partner's belief is {agent2_predicted_agent1_belief}%
-    **Partner's Initial Assessment**: Your partner initially estimated a {agent1_belief}% chance that the collaboration would be successful.
-
-    **Full Communication History**:
-    - Partner's initial message: "{agent1_message}"
-    - Your first reply: "{agent2_first_reply}"
-    - Partner's second message: "{agent1_second_message}"
-    - Your second reply: "{agent2_second_reply}"
-    - Partner's third message: "{agent1_third_message}"
-    - Your third reply: "{agent2_third_reply}"
-
-    **Your Task Options**:
-    - K: Upside = {task['options']['K']['upside']}, Downside = {task['options']['K']['downside']}
-    - L: Upside = {task['options']['L']['upside']}, Downside = {task['options']['L']['downside']}
-    - M: Upside = {task['options']['M']['upside']}, Downside = {task['options']['M']['downside']}
-    - Y: Guaranteed = {task['options']['Y']['guaranteed']} points
-
-    **Key Facts**:
-    - The minimum required collaboration belief ("u-value"): {int(task['u_value']*100)} percent
-
-    Choose your car design:
-    - Designs K, L, or M (collaborative)
-    - Design Y (individual): Guaranteed {task['options']['Y']['guaranteed']} points
-
-    Make your decision based on:
-    1. Your updated belief about collaboration success
-    2. Your prediction of what your partner believes
-    3. The complete conversation history
-    4. The u-value threshold
-
-    Respond in JSON format: {{"choice": "K"/"L"/"M"/"Y", "strategy": "collaborative"/"individual", "reasoning": "your explanation"}}"""
-
-    response = client.chat.completions.create(
-        model="gpt-5-nano",
-        messages=[
-            {"role": "developer", "content": context_prompt},
-            {"role": "user", "content": decision_prompt}
-        ]
+    if task['forced_choice']:
+        return forced_decision(task)
+
+    decision_prompt = _DECISION_TEMPLATE_A2.format(
+        belief=agent2_belief,
+        updated_belief=agent2_updated_belief,
+        predicted_belief=agent2_predicted_agent1_belief,
+        partner_belief=agent1_belief,
+        conversation=[agent1_message, agent2_first_reply, agent1_second_message, agent2_second_reply, agent1_third_message, agent2_third_reply],
+        payoffs_table=task['decision_table'],
+        u_value_percent=int(task['u_value'] * 100),
+        guaranteed=task['options']['Y']['guaranteed'],
     )
 
-    decision_text = response.choices[0].message.content.strip()
-    print(f"Decision response : {decision_text}".encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
-    decision_text = clean_json_response(decision_text)
-    decision_data = json.loads(decision_text)
+    decision_data = await complete_json(decision_prompt, "Decision", "decision-2", response_format=DECISION_FORMAT_A2)
 
     return {
         "choice": decision_data["choice"],
@@ -616,28 +1039,30 @@ def run_second_agent_decision(task, agent2_belief, agent1_belief, agent2_updated
 # ============================================================================
 
 def safe_print(text):
-    """Helper function to safely print text with Unicode characters"""
-    try:
-        print(text)
-    except UnicodeEncodeError:
-        # Fallback: encode with 'replace' to handle problematic characters
-        print(text.encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
+    """Helper function to print text with Unicode characters (stdout is reconfigured to UTF-8 at import)"""
+    print(text)
+
 
+def format_indifference(task):
+    """Format a task's precomputed break-even beliefs for display, e.g. A=0.92, B=0.91, C=0.93"""
+    return ", ".join(f"{label}={p:.2f}" for label, p in task['indifference_beliefs'].items())
 
-def clean_json_response(text):
+
+def new_trial_id():
     """
-    Clean JSON response text by removing common problematic characters
-    that LLMs sometimes add at the end
+    Trial IDs are the process's RUN_ID plus a monotonic counter, so trials within a run
+    stay in order and never collide with another process that has a different RUN_ID
     """
-    text = text.strip()
-    # Remove trailing "> after closing brace or quote
-    if text.endswith('">'):
-        text = text[:-2] + '"'
-    elif text.endswith("'>"):
-        text = text[:-2] + "'"
-    elif text.endswith('}>'):
-        text = text[:-1]
-    return text
+    return f"{RUN_ID}-{next(_trial_counter):04x}"
+
+
+def trial_seed(trial_id, task):
+    """
+    Deterministic per-(trial, task, agent) sampling seed; uses a stable digest rather than
+    hash(), which is salted differently in every Python process
+    """
+    digest = hashlib.blake2b(f"{trial_id}:{task['task_id']}:{task['agent_id']}".encode("utf-8"), digest_size=4).digest()
+    return int.from_bytes(digest, "big") & 0x7FFFFFFF
 
 
 def check_strategy_mismatch(agent1_strategy, agent2_strategy):
@@ -650,62 +1075,181 @@ def check_strategy_mismatch(agent1_strategy, agent2_strategy):
     return 0
 
 
-def save_result_to_file(task_agent1, task_agent2, agent1_decision, agent2_decision, agent1_belief, agent2_belief, mismatch):
+# (epoch second, formatted timestamp) of the last result line
+_last_timestamp = (None, "")
+
+
+def result_timestamp():
+    """
+    Local time as "YYYY-MM-DD HH:MM:SS" for a result line. Lines are stamped to the second,
+    so concurrent trials finishing in the same second reuse one formatted string
     """
-    Append the test result to the results file for asymmetric tasks
+    global _last_timestamp
+    second = int(time.time())
+    if _last_timestamp[0] != second:
+        _last_timestamp = (second, datetime.fromtimestamp(second).strftime("%Y-%m-%d %H:%M:%S"))
+    return _last_timestamp[1]
+
+
+def save_result_to_file(results_fh, trial_id, task_agent1, task_agent2, agent1_decision, agent2_decision, agent1_belief, agent2_belief, mismatch):
+    """
+    Append the test result to the (buffered) results file handle for asymmetric tasks
+    """
+    timestamp = result_timestamp()
+
+    result_line = (
+        f"{timestamp} | "
+        f"Trial_ID:{trial_id} | "
+        f"Task_ID:{task_agent1['task_id']} | "
+        f"Agent1_U_Value:{task_agent1['u_value']} | "
+        f"Agent2_U_Value:{task_agent2['u_value']} | "
+        f"Agent1_Belief:{agent1_belief} | "
+        f"Agent2_Belief:{agent2_belief} | "
+        f"Agent1_Choice:{agent1_decision['choice']} | "
+        f"Agent1_Strategy:{agent1_decision['strategy']} | "
+        f"Agent2_Choice:{agent2_decision['choice']} | "
+        f"Agent2_Strategy:{agent2_decision['strategy']} | "
+        f"Mismatch:{mismatch}\n"
+    )
+    results_fh.write(result_line)
+
+    print(f"\nMismatch: {mismatch} (1 = mismatch, 0 = no mismatch)")
+
+
+# ============================================================================
+# TRIAL STORE
+# ============================================================================
+
+@dataclass
+class TrialStore:
     """
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    Per-run trial records kept column-wise: one preallocated array per field, indexed by trial slot
 
-    with open(RESULTS_FILE, 'a', encoding='utf-8') as f:
-        result_line = (
-            f"{timestamp} | "
-            f"Task_ID:{task_agent1['task_id']} | "
-            f"Agent1_U_Value:{task_agent1['u_value']} | "
-            f"Agent2_U_Value:{task_agent2['u_value']} | "
-            f"Agent1_Belief:{agent1_belief} | "
-            f"Agent2_Belief:{agent2_belief} | "
-            f"Agent1_Choice:{agent1_decision['choice']} | "
-            f"Agent1_Strategy:{agent1_decision['strategy']} | "
-            f"Agent2_Choice:{agent2_decision['choice']} | "
-            f"Agent2_Strategy:{agent2_decision['strategy']} | "
-            f"Mismatch:{mismatch}\n"
+    Choices are stored as the option's position in the task's option table (Y is last).
+    Trials finish in any order, so `recorded` marks the slots that hold a completed trial.
+    """
+    task_ids: np.ndarray
+    beliefs_a1: np.ndarray
+    beliefs_a2: np.ndarray
+    final_beliefs_a1: np.ndarray
+    final_beliefs_a2: np.ndarray
+    choices_a1: np.ndarray
+    choices_a2: np.ndarray
+    collaborative_a1: np.ndarray
+    collaborative_a2: np.ndarray
+    mismatches: np.ndarray
+    recorded: np.ndarray
+
+    @classmethod
+    def allocate(cls, n_trials):
+        """Preallocate zeroed columns for n_trials trials"""
+        return cls(
+            task_ids=np.zeros(n_trials, dtype=np.int32),
+            beliefs_a1=np.zeros(n_trials, dtype=np.float32),
+            beliefs_a2=np.zeros(n_trials, dtype=np.float32),
+            final_beliefs_a1=np.zeros(n_trials, dtype=np.float32),
+            final_beliefs_a2=np.zeros(n_trials, dtype=np.float32),
+            choices_a1=np.zeros(n_trials, dtype=np.uint8),
+            choices_a2=np.zeros(n_trials, dtype=np.uint8),
+            collaborative_a1=np.zeros(n_trials, dtype=np.bool_),
+            collaborative_a2=np.zeros(n_trials, dtype=np.bool_),
+            mismatches=np.zeros(n_trials, dtype=np.uint8),
+            recorded=np.zeros(n_trials, dtype=np.bool_),
         )
-        f.write(result_line)
 
-    print(f"\nResult saved to {RESULTS_FILE}")
-    print(f"Mismatch: {mismatch} (1 = mismatch, 0 = no mismatch)")
+
+def choice_index(task, choice):
+    """Position of a chosen option in the task's option table, or 255 if the model named no valid option"""
+    labels = list(task['options'])
+    return labels.index(choice) if choice in labels else 255
+
+
+def payoff_arrays(options):
+    """Split an option table into (upsides, downsides) arrays for the collaborative options plus Y's guaranteed payoff"""
+    collaborative = [option for label, option in options.items() if label != "Y"]
+    upsides = np.array([option["upside"] for option in collaborative], dtype=np.float32)
+    downsides = np.array([option["downside"] for option in collaborative], dtype=np.float32)
+    return upsides, downsides, options["Y"]["guaranteed"]
+
+
+def ev_choices(beliefs, upsides, downsides, guaranteed):
+    """
+    Expected-value-maximizing choice for every belief (0-100) in one vectorized pass
+
+    Returns option indices in the same encoding as TrialStore choices: the best
+    collaborative option, or len(upsides) (Y) when the guaranteed payoff is higher.
+    """
+    p = (beliefs.astype(np.float32) / 100)[:, None]
+    ev = p * upsides + (1 - p) * downsides
+    best = ev.argmax(axis=1)
+    return np.where(ev.max(axis=1) > guaranteed, best, len(upsides)).astype(np.uint8)
+
+
+def print_run_summary(store):
+    """Print aggregate statistics over all recorded trials"""
+    done = store.recorded
+    n = int(done.sum())
+    if n == 0:
+        return
+
+    both_collaborative = store.collaborative_a1[done] & store.collaborative_a2[done]
+    # Belief convergence: how far apart the agents' beliefs are before and after the exchanges
+    initial_gap = np.abs(store.beliefs_a1[done] - store.beliefs_a2[done])
+    final_gap = np.abs(store.final_beliefs_a1[done] - store.final_beliefs_a2[done])
+    # Did each agent pick the EV-optimal option for the belief it ended the conversation with?
+    ev_match_a1 = store.choices_a1[done] == ev_choices(store.final_beliefs_a1[done], *payoff_arrays(AGENT1_OPTIONS))
+    ev_match_a2 = store.choices_a2[done] == ev_choices(store.final_beliefs_a2[done], *payoff_arrays(AGENT2_OPTIONS))
+    print("\n" + "=" * 80)
+    print(f"RUN SUMMARY ({n} trials)")
+    print("=" * 80)
+    print(f"Agent 1 initial belief: mean={store.beliefs_a1[done].mean():.1f}%, std={store.beliefs_a1[done].std():.1f}%")
+    print(f"Agent 2 initial belief: mean={store.beliefs_a2[done].mean():.1f}%, std={store.beliefs_a2[done].std():.1f}%")
+    print(f"Agent 1 final belief:   mean={store.final_beliefs_a1[done].mean():.1f}%, std={store.final_beliefs_a1[done].std():.1f}%")
+    print(f"Agent 2 final belief:   mean={store.final_beliefs_a2[done].mean():.1f}%, std={store.final_beliefs_a2[done].std():.1f}%")
+    print(f"Belief gap |A1 - A2|:   initial mean={initial_gap.mean():.1f} pts, final mean={final_gap.mean():.1f} pts")
+    print(f"Both collaborative: {both_collaborative.mean() * 100:.1f}%")
+    print(f"Mismatch rate:      {store.mismatches[done].mean() * 100:.1f}%")
+    print(f"EV-optimal choice given final belief: Agent 1 {ev_match_a1.mean() * 100:.1f}%, Agent 2 {ev_match_a2.mean() * 100:.1f}%")
+    print("=" * 80)
 
 
 # ============================================================================
 # MAIN EXECUTION
 # ============================================================================
 
-def main():
+async def run_trial(results_fh, store, slot):
+    """
+    Run one complete trial (beliefs, three exchanges, decisions) and record its result
+    in the results file and in slot `slot` of the trial store
+    """
+    trial_id = new_trial_id()
+
     # Create asymmetric tasks for both agents
     task_agent1, task_agent2 = create_asymmetric_tasks(task_id=1)
 
     print("=" * 80)
-    print("ASYMMETRIC PAYOFF EXPERIMENT")
+    print(f"ASYMMETRIC PAYOFF EXPERIMENT (Trial {trial_id})")
     print("=" * 80)
-    print(f"Agent 1: Options A/B/C/Y, U-value={task_agent1['u_value']}")
-    print(f"Agent 2: Options K/L/M/Y, U-value={task_agent2['u_value']}")
+    print(f"Agent 1: Options A/B/C/Y, U-value={task_agent1['u_value']}, Break-even beliefs: {format_indifference(task_agent1)}")
+    print(f"Agent 2: Options K/L/M/Y, U-value={task_agent2['u_value']}, Break-even beliefs: {format_indifference(task_agent2)}")
     print("=" * 80)
 
-    # Step 1: Agent 1 forms belief and sends initial message
-    print("\n=== Agent 1 Belief ===")
-    agent1_belief_data = run_first_agent_belief(task_agent1)
+    # Steps 1-2: Both agents form their beliefs independently, so the two calls run concurrently
+    print("\n=== Agent 1 & Agent 2 Beliefs ===")
+    agent1_belief_data, agent2_belief_data = await asyncio.gather(
+        run_first_agent_belief(task_agent1, seed=trial_seed(trial_id, task_agent1)),
+        run_second_agent_belief(task_agent2, seed=trial_seed(trial_id, task_agent2)),
+    )
     agent1_belief = agent1_belief_data["belief"]
     agent1_message = agent1_belief_data["message_to_agent_2"]
-
-    # Step 2: Agent 2 forms belief and sends first reply
-    print("\n=== Agent 2 Belief ===")
-    agent2_belief_data = run_second_agent_belief(task_agent2)
     agent2_belief = agent2_belief_data["belief"]
     agent2_initial_message = agent2_belief_data["message_to_agent_1"]
 
     print("\n=== Agent 2's First Reply ===")
-    agent2_first_reply_data = agent_2_reply_to_agent_1(task_agent2, agent1_message, agent2_belief)
-    agent2_first_reply = agent2_first_reply_data["reply_to_agent_1"]
+    conversation = [agent1_message]
+    agent2_first_reply_data = await agent_exchange(2, 1, task_agent2, conversation, agent2_belief)
+    agent2_first_reply = agent2_first_reply_data["message"]
+    conversation.append(agent2_first_reply)
     agent2_updated_belief_1 = agent2_first_reply_data["updated_belief"]
     agent2_predicted_agent1_belief_1 = agent2_first_reply_data["predicted_other_agent_belief"]
     safe_print(f"\n[Agent 2 After Exchange 1]")
@@ -714,8 +1258,9 @@ def main():
 
     # Step 3: Agent 1 sends second message
     print("\n=== Agent 1's Second Message ===")
-    agent1_second_message_data = agent_1_reply_to_agent_2(task_agent1, agent1_message, agent2_first_reply, agent1_belief)
-    agent1_second_message = agent1_second_message_data["reply_to_agent_2"]
+    agent1_second_message_data = await agent_exchange(1, 1, task_agent1, conversation, agent1_belief)
+    agent1_second_message = agent1_second_message_data["message"]
+    conversation.append(agent1_second_message)
     agent1_updated_belief_1 = agent1_second_message_data["updated_belief"]
     agent1_predicted_agent2_belief_1 = agent1_second_message_data["predicted_other_agent_belief"]
     safe_print(f"\n[Agent 1 After Exchange 1]")
@@ -724,8 +1269,9 @@ def main():
 
     # Step 4: Agent 2 sends second reply (using updated belief from first exchange and previous prediction)
     print("\n=== Agent 2's Second Reply ===")
-    agent2_second_reply_data = agent_2_second_reply_to_agent_1(task_agent2, agent1_message, agent2_first_reply, agent1_second_message, agent2_updated_belief_1, agent2_predicted_agent1_belief_1)
-    agent2_second_reply = agent2_second_reply_data["reply_to_agent_1"]
+    agent2_second_reply_data = await agent_exchange(2, 2, task_agent2, conversation, agent2_updated_belief_1, agent2_predicted_agent1_belief_1)
+    agent2_second_reply = agent2_second_reply_data["message"]
+    conversation.append(agent2_second_reply)
     agent2_updated_belief_2 = agent2_second_reply_data["updated_belief"]
     agent2_predicted_agent1_belief_2 = agent2_second_reply_data["predicted_other_agent_belief"]
     safe_print(f"\n[Agent 2 After Exchange 2]")
@@ -734,8 +1280,9 @@ def main():
 
     # Step 5: Agent 1 sends third message (using updated belief from first exchange and previous prediction)
     print("\n=== Agent 1's Third Message ===")
-    agent1_third_message_data = agent_1_third_message_to_agent_2(task_agent1, agent1_message, agent2_first_reply, agent1_second_message, agent2_second_reply, agent1_updated_belief_1, agent1_predicted_agent2_belief_1)
-    agent1_third_message = agent1_third_message_data["message_to_agent_2"]
+    agent1_third_message_data = await agent_exchange(1, 2, task_agent1, conversation, agent1_updated_belief_1, agent1_predicted_agent2_belief_1)
+    agent1_third_message = agent1_third_message_data["message"]
+    conversation.append(agent1_third_message)
     agent1_updated_belief_2 = agent1_third_message_data["updated_belief"]
     agent1_predicted_agent2_belief_2 = agent1_third_message_data["predicted_other_agent_belief"]
     safe_print(f"\n[Agent 1 After Exchange 2]")
@@ -744,8 +1291,9 @@ def main():
 
     # Step 6: Agent 2 sends third reply (using updated belief from second exchange and previous prediction)
     print("\n=== Agent 2's Third Reply ===")
-    agent2_third_reply_data = agent_2_third_reply_to_agent_1(task_agent2, agent1_message, agent2_first_reply, agent1_second_message, agent2_second_reply, agent1_third_message, agent2_updated_belief_2, agent2_predicted_agent1_belief_2)
-    agent2_third_reply = agent2_third_reply_data["reply_to_agent_1"]
+    agent2_third_reply_data = await agent_exchange(2, 3, task_agent2, conversation, agent2_updated_belief_2, agent2_predicted_agent1_belief_2)
+    agent2_third_reply = agent2_third_reply_data["message"]
+    conversation.append(agent2_third_reply)
     agent2_updated_belief_3 = agent2_third_reply_data["updated_belief"]
     agent2_predicted_agent1_belief_3 = agent2_third_reply_data["predicted_other_agent_belief"]
     safe_print(f"\n[Agent 2 After Exchange 3]")
@@ -755,12 +1303,13 @@ def main():
     # Display complete communication channel
     communication_channel(agent1_message, agent2_first_reply, agent1_second_message, agent2_second_reply, agent1_third_message, agent2_third_reply)
 
-    # Step 7: Both agents make decisions with full conversation history
-    print("=== Agent 1 Decision ===")
-    agent1_decision = run_first_agent_decision(task_agent1, agent1_belief, agent2_belief, agent1_updated_belief_2, agent1_predicted_agent2_belief_2, agent1_message, agent2_first_reply, agent1_second_message, agent2_second_reply, agent1_third_message, agent2_third_reply)
-
-    print("\n=== Agent 2 Decision ===")
-    agent2_decision = run_second_agent_decision(task_agent2, agent2_belief, agent1_belief, agent2_updated_belief_3, agent2_predicted_agent1_belief_3, agent1_message, agent2_first_reply, agent1_second_message, agent2_second_reply, agent1_third_message, agent2_third_reply)
+    # Step 7: Both agents make decisions with full conversation history; neither sees the
+    # other's decision, so the two calls run concurrently
+    print("=== Agent 1 & Agent 2 Decisions ===")
+    agent1_decision, agent2_decision = await asyncio.gather(
+        run_first_agent_decision(task_agent1, agent1_belief, agent2_belief, agent1_updated_belief_2, agent1_predicted_agent2_belief_2, agent1_message, agent2_first_reply, agent1_second_message, agent2_second_reply, agent1_third_message, agent2_third_reply),
+        run_second_agent_decision(task_agent2, agent2_belief, agent1_belief, agent2_updated_belief_3, agent2_predicted_agent1_belief_3, agent1_message, agent2_first_reply, agent1_second_message, agent2_second_reply, agent1_third_message, agent2_third_reply),
+    )
 
     print("\nFinal Decisions:")
     safe_print(f"Agent 1 chose {agent1_decision['choice']} ({agent1_decision['strategy']}) - Reasoning: {agent1_decision['reasoning']}")
@@ -768,8 +1317,60 @@ def main():
 
     # Check for strategy mismatch and save results
     mismatch = check_strategy_mismatch(agent1_decision['strategy'], agent2_decision['strategy'])
-    save_result_to_file(task_agent1, task_agent2, agent1_decision, agent2_decision, agent1_belief, agent2_belief, mismatch)
+    save_result_to_file(results_fh, trial_id, task_agent1, task_agent2, agent1_decision, agent2_decision, agent1_belief, agent2_belief, mismatch)
+
+    store.task_ids[slot] = task_agent1['task_id']
+    store.beliefs_a1[slot] = agent1_belief
+    store.beliefs_a2[slot] = agent2_belief
+    store.final_beliefs_a1[slot] = agent1_updated_belief_2
+    store.final_beliefs_a2[slot] = agent2_updated_belief_3
+    store.choices_a1[slot] = choice_index(task_agent1, agent1_decision['choice'])
+    store.choices_a2[slot] = choice_index(task_agent2, agent2_decision['choice'])
+    store.collaborative_a1[slot] = agent1_decision['strategy'] == "collaborative"
+    store.collaborative_a2[slot] = agent2_decision['strategy'] == "collaborative"
+    store.mismatches[slot] = mismatch
+    store.recorded[slot] = True
+
+
+async def main():
+    print(f"Run ID: {RUN_ID}")
+
+    # Keep one buffered handle open for the whole run instead of reopening the file per trial;
+    # closing at exit (including Ctrl+C) flushes whatever is still buffered
+    results_fh = open(RESULTS_FILE, 'a', encoding='utf-8', buffering=1 << 20)
+    atexit.register(results_fh.close)
+
+    store = TrialStore.allocate(NUM_TRIALS)
+    # In batch mode every trial has to be in flight so each stage fills a single batch
+    semaphore = asyncio.Semaphore(NUM_TRIALS if BATCH_MODE else MAX_CONCURRENT_TRIALS)
+    completed = 0
+
+    async def run_bounded(slot):
+        # Calls inside a trial stay sequential (each turn needs the previous one);
+        # independent trials overlap up to MAX_CONCURRENT_TRIALS at a time
+        nonlocal completed
+        async with semaphore:
+            await run_trial(results_fh, store, slot)
+        completed += 1
+        if completed % RESULTS_FLUSH_EVERY == 0:
+            results_fh.flush()
+
+    try:
+        outcomes = await asyncio.gather(*(run_bounded(slot) for slot in range(NUM_TRIALS)), return_exceptions=True)
+    finally:
+        await client.close()
+
+    failures = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+    for failure in failures:
+        print("\nTrial failed:")
+        traceback.print_exception(failure)
+
+    print(f"\n{NUM_TRIALS - len(failures)} result(s) saved to {RESULTS_FILE}")
+
+    print_run_summary(store)
+    if failures:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())